@@ -0,0 +1,110 @@
+#assignment.py
+import heapq
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from config import SLOT_MINUTES, ASSIGN_LOAD_WINDOW_HOURS, TIMEZONE
+from database import Specialist
+from slots import SlotIndex
+
+# Free specialists ranked by: from the client's city first, then lighter load in the window.
+# There is no specialist quality signal to rank by: Rating holds the scores specialists give clients.
+# Specialists are bucketed by city in id order, so a decision only looks past the client's city
+# when it has too few free specialists, and stops early once enough idle ones are found.
+Candidate = namedtuple('Candidate', 'specialist_id name username local load')
+
+
+def naive(date: datetime):
+    # Appointment dates are stored as naive local time
+    return date.astimezone(TIMEZONE).replace(tzinfo=None) if date.tzinfo else date
+
+
+class AssignmentEngine:
+    def __init__(self, index: SlotIndex, load_window: timedelta):
+        self.index = index
+        self.load_window = load_window
+        self.specialists = {}
+        self.by_city = {}
+
+    async def load(self, session):
+        res = await session.execute(
+            select(Specialist.id, Specialist.name, Specialist.username, Specialist.city,
+                   Specialist.is_available)
+            .where(Specialist.is_active == True)
+            .order_by(Specialist.id)
+        )
+        self.specialists.clear()
+        self.by_city.clear()
+        for spec_id, name, username, city, available in res.all():
+            city = (city or '').strip().lower()
+            self.specialists[spec_id] = {
+                'name': name,
+                'username': username,
+                'city': city,
+                'available': bool(available),
+            }
+            self.by_city.setdefault(city, []).append(spec_id)
+        await self.index.load(session, naive(datetime.now(TIMEZONE)))
+
+    # Sharded mode: other shards book, cancel and toggle availability, so the in-memory
+    # state is stale there. These read just what one decision needs from the database.
+    async def read_index(self, session, since: datetime, until: datetime = None, specialist_id: int = None):
+        index = SlotIndex(self.index.duration)
+        await index.load(session, since, until, specialist_id)
+        return index
+
+    async def refresh(self, session, date: datetime):
+        available = dict((await session.execute(
+            select(Specialist.id, Specialist.is_available).where(Specialist.is_active == True)
+        )).all())
+        for spec_id, spec in self.specialists.items():
+            spec['available'] = bool(available.get(spec_id))
+        date = naive(date)
+        return await self.read_index(session, date - self.load_window, date + self.load_window + self.index.duration)
+
+    def set_available(self, specialist_id: int, available: bool):
+        if specialist_id in self.specialists:
+            self.specialists[specialist_id]['available'] = available
+
+    def _candidate(self, index: SlotIndex, spec_id: int, date: datetime, city: str):
+        spec = self.specialists[spec_id]
+        if not spec['available'] or index.has_conflict(spec_id, date):
+            return None
+        load = index.count_between(spec_id, date - self.load_window, date + self.load_window)
+        return Candidate(spec_id, spec['name'], spec['username'], bool(city) and spec['city'] == city, load)
+
+    def _top(self, index: SlotIndex, spec_ids, date: datetime, city: str, limit: int):
+        # spec_ids ascend, so once `limit` free specialists with no load are found
+        # nobody later can rank above them
+        found, idle = [], 0
+        for spec_id in spec_ids:
+            candidate = self._candidate(index, spec_id, date, city)
+            if candidate:
+                found.append(candidate)
+                if candidate.load == 0:
+                    idle += 1
+                    if idle == limit:
+                        break
+        key = lambda c: (c.load, c.specialist_id)
+        return heapq.nsmallest(limit, found, key=key) if limit else sorted(found, key=key)
+
+    # Free specialists, best first; `limit` keeps only the top ones
+    def rank(self, date: datetime, city: str = None, limit: int = None, index: SlotIndex = None):
+        index = index or self.index
+        date = naive(date)
+        city = (city or '').strip().lower()
+        local = self._top(index, self.by_city.get(city, ()), date, city, limit) if city else []
+        if limit and len(local) >= limit:
+            return local
+        others = (spec_id for spec_id in self.specialists if not city or self.specialists[spec_id]['city'] != city)
+        return local + self._top(index, others, date, city, limit and limit - len(local))
+
+    def best(self, date: datetime, city: str = None, index: SlotIndex = None):
+        ranked = self.rank(date, city, limit=1, index=index)
+        return ranked[0] if ranked else None
+
+
+assigner = AssignmentEngine(
+    SlotIndex(timedelta(minutes=SLOT_MINUTES)),
+    timedelta(hours=ASSIGN_LOAD_WINDOW_HOURS)
+)
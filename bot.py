@@ -1,76 +1,107 @@
 import logging
+import os
+import sys
 from datetime import datetime, timedelta
 import pytz
 from sqlalchemy.exc import NoResultFound
-from sqlalchemy.orm import joinedload
 from sqlalchemy import update, delete
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command, CommandStart
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
-from aiogram.types import ReplyKeyboardRemove
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import ReplyKeyboardRemove, FSInputFile
 from sqlalchemy import select, func
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import CommandObject
-from config import API_TOKEN, ADMIN_ID, SPECIALISTS, TIMEZONE, CODEWORD
-from database import AsyncSessionMaker, Client, Specialist, Appointment, Blacklist, init_db, StatusEnum, ClientStatus
-from states import ClientStates, AdminStates, SpecialistStates
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from keyboards import client_main_keyboard, admin_main_keyboard, specialist_main_keyboard, confirmation_keyboard
+from config import API_TOKEN, ADMIN_ID, TIMEZONE, CODEWORD, MODE, API_SERVER, METRICS_HOST, METRICS_PORT, AUTO_ASSIGN, SHARDS, SHARD_INDEX
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionMaker, Client, Specialist, Appointment, Blacklist, Rating, StatusEnum, ClientStatus
+from state import ClientStates, AdminStates, SpecialistStates
+from jobs import create_scheduler, register_jobs
+from storage import create_storage
+from migrations import migrate
+from outbox import outbox
+from pagination import Keyset, fetch_page
+from repository import appointments, get_appointment, get_client_id, get_specialist_id
+import stats
+import ratings
+import broadcast
+import search
+from middlewares import DbSessionMiddleware, CallbackDataMiddleware
+from callbacks import Is, Confirm, Cancel, PickSpecialist, Rate, Page, SearchPage
+import metrics
+from roster import load_roster, sync_specialists
+from assignment import assigner, naive
+from cache import role_cache, invalidate_user, MISSING
+from keyboards import KeyboardSession, client_main_keyboard, admin_main_keyboard, specialist_main_keyboard, confirmation_keyboard, client_confirm_keyboard, rating_keyboard, pagination_keyboard, search_keyboard
 
 # Logging
 logging.basicConfig(level=logging.INFO)
-bot = Bot(token=API_TOKEN)
-storage = MemoryStorage()
+if API_SERVER:
+    bot = Bot(token=API_TOKEN, session=KeyboardSession(api=TelegramAPIServer.from_base(API_SERVER)))
+else:
+    bot = Bot(token=API_TOKEN, session=KeyboardSession())
+storage = create_storage()
 dp = Dispatcher(storage=storage)
-scheduler = AsyncIOScheduler()
+metrics.setup(dp)
+dp.update.outer_middleware(DbSessionMiddleware())
+dp.callback_query.outer_middleware(CallbackDataMiddleware())
+scheduler = None
+# Several processes share the database: in-memory slot state is only local to this shard
+SHARED = MODE == 'sharded' and SHARDS > 1
+
+# Keyset pagination orders
+APPOINTMENTS_KEYSET = Keyset(Appointment.created_at, Appointment.id, descending=True)
+SCHEDULE_KEYSET = Keyset(Appointment.date, Appointment.id)
+BLACKLIST_KEYSET = Keyset(Blacklist.id)
 
 # Check blacklist
-async def check_blacklist(user_id: int):
-    async with AsyncSessionMaker() as session:
+async def check_blacklist(session: AsyncSession, user_id: int):
+    until = role_cache.get(('blacklist', user_id))
+    if until is MISSING:
         res = await session.execute(
             select(Blacklist).where(Blacklist.client_id == user_id)
         )
         entry = res.scalar_one_or_none()
-        if entry and entry.until > datetime.now(pytz.utc):
-            return True
+        until = entry.until if entry else None
+        role_cache.set(('blacklist', user_id), until)
+    # Stored naive in UTC, like jobs.purge_blacklist compares it
+    if until and until > datetime.now(pytz.utc).replace(tzinfo=None):
+        return True
     return False
 
 # Determine user role
-async def get_user_role(user_id: int):
+async def get_user_role(session: AsyncSession, user_id: int):
     if user_id == ADMIN_ID:
         return 'admin'
-    async with AsyncSessionMaker() as session:
-        res = await session.execute(
-            select(Specialist).where(Specialist.telegram_id == user_id)
-        )
-        if res.scalar_one_or_none():
-            return 'specialist'
-        res = await session.execute(
-            select(Client).where(Client.telegram_id == user_id)
-        )
-        if res.scalar_one_or_none():
-            return 'client'
-    return None
+    role = role_cache.get(('role', user_id))
+    if role is not MISSING:
+        return role
+    role = None
+    if await get_specialist_id(session, user_id):
+        role = 'specialist'
+    elif await get_client_id(session, user_id):
+        role = 'client'
+    role_cache.set(('role', user_id), role)
+    return role
 
 # Start handler
 @dp.message(CommandStart())
-async def start_handler(message: types.Message, state: FSMContext):
+async def start_handler(message: types.Message, state: FSMContext, session: AsyncSession):
     user_id = message.from_user.id
-    role = await get_user_role(user_id)
+    role = await get_user_role(session, user_id)
     if role == 'admin':
         await message.answer('Панель администратора', reply_markup=admin_main_keyboard())
     elif role == 'specialist':
-        async with AsyncSessionMaker() as session:
-            count = await session.scalar(
-                select(func.count(Appointment.id)).where(
-                    Appointment.specialist_id == user_id,
-                    Appointment.status == StatusEnum.approved
-                )
+        count = await session.scalar(
+            select(func.count(Appointment.id)).where(
+                Appointment.specialist_id == user_id,
+                Appointment.status == StatusEnum.approved
             )
+        )
         await message.answer('Панель специалиста', reply_markup=specialist_main_keyboard(count > 0))
     else:
-        if await check_blacklist(user_id):
+        if await check_blacklist(session, user_id):
             await message.answer('🚫 Вы в черном списке!', reply_markup=ReplyKeyboardRemove())
             return
         await message.answer('Добро пожаловать! Введите кодовое слово:')
@@ -88,7 +119,7 @@ async def process_codeword(message: types.Message, state: FSMContext):
 
 # Registration multi-step
 @dp.message(ClientStates.registration)
-async def process_registration(message: types.Message, state: FSMContext):
+async def process_registration(message: types.Message, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
     current_step = data.get('reg_step', 0)
     steps = [
@@ -112,20 +143,21 @@ async def process_registration(message: types.Message, state: FSMContext):
         await state.update_data(reg_step=current_step+1)
     else:
         # all data collected
-        async with AsyncSessionMaker() as session:
-            data = await state.get_data()
-            client = Client(
-                telegram_id=data['telegram_id'],
-                name=data['name'],
-                city=data['city'],
-                workplace=data['workplace'],
-                product_type=data['product_type'],
-                serial_number=data['serial_number'],
-                phone=message.text,
-                status=ClientStatus.active
-            )
-            session.add(client)
-            await session.commit()
+        data = await state.get_data()
+        client = Client(
+            telegram_id=data['telegram_id'],
+            name=data['name'],
+            city=data['city'],
+            workplace=data['workplace'],
+            product_type=data['product_type'],
+            serial_number=data['serial_number'],
+            phone=message.text,
+            status=ClientStatus.active
+        )
+        session.add(client)
+        await stats.record_client(session)
+        await session.commit()
+        invalidate_user(data['telegram_id'])
         await message.answer('✅ Регистрация завершена!', reply_markup=client_main_keyboard())
         await state.clear()
 
@@ -137,24 +169,24 @@ async def new_request(message: types.Message, state: FSMContext):
 
 # Process reason
 @dp.message(ClientStates.collecting_reason)
-async def process_reason(message: types.Message, state: FSMContext):
-    async with AsyncSessionMaker() as session:
-        res = await session.execute(
-            select(Client).where(Client.telegram_id == message.from_user.id)
-        )
-        client = res.scalar_one()
+async def process_reason(message: types.Message, state: FSMContext, session: AsyncSession):
+    res = await session.execute(
+        select(Client).where(Client.telegram_id == message.from_user.id)
+    )
+    client = res.scalar_one()
 
-        appointment = Appointment(
-            client_id=client.id,
-            description=message.text,
-            created_at=datetime.now(pytz.utc),
-            status=StatusEnum.pending
-        )
-        session.add(appointment)
-        await session.commit()
+    appointment = Appointment(
+        client_id=client.id,
+        description=message.text,
+        created_at=datetime.now(pytz.utc),
+        status=StatusEnum.pending
+    )
+    session.add(appointment)
+    await stats.record_appointment(session, appointment, client.city)
+    await session.commit()
 
     # ✉️ Уведомление админу
-    await bot.send_message(
+    outbox.send_message(
         ADMIN_ID,
         f"📩 Новая заявка #{appointment.id} от {client.name}:\n\n{message.text}",
         reply_markup=confirmation_keyboard(appointment.id)
@@ -164,9 +196,9 @@ async def process_reason(message: types.Message, state: FSMContext):
     await state.clear()
 
 # Обработка подтверждения/отмены
-@dp.callback_query(F.data.startswith("confirm_"))
-async def confirm_appointment(callback: types.CallbackQuery, state: FSMContext):
-    appointment_id = int(callback.data.split("_")[1])
+@dp.callback_query(Is(Confirm))
+async def confirm_appointment(callback: types.CallbackQuery, callback_data: Confirm, state: FSMContext):
+    appointment_id = callback_data.appointment_id
     await state.update_data(appointment_id=appointment_id)
     await callback.message.edit_reply_markup()  # Удаляем кнопки
     await callback.message.answer("📅 Введите дату и время в формате ДД.ММ.ГГГГ ЧЧ:ММ")
@@ -174,26 +206,38 @@ async def confirm_appointment(callback: types.CallbackQuery, state: FSMContext):
 
 
 @dp.message(AdminStates.selecting_date)
-async def process_date(message: types.Message, state: FSMContext):
+async def process_date(message: types.Message, state: FSMContext, session: AsyncSession):
     try:
         date = datetime.strptime(message.text, "%d.%m.%Y %H:%M")
         date = TIMEZONE.localize(date)
-        await state.update_data(appointment_date=date)
+        await state.update_data(appointment_date=date.isoformat())
 
-        # Получаем доступных специалистов
-        async with AsyncSessionMaker() as session:
-            specialists = await session.scalars(
-                select(Specialist).where(Specialist.is_available == True)
-            )
-            specialists = specialists.all()
+        data = await state.get_data()
+        city = await session.scalar(
+            select(Client.city)
+            .join(Appointment, Appointment.client_id == Client.id)
+            .where(Appointment.id == data['appointment_id'])
+        )
+        index = await assigner.refresh(session, date) if SHARED else None
+        # Telegram allows at most 100 inline buttons
+        candidates = assigner.rank(date, city, limit=1 if AUTO_ASSIGN else 100, index=index)
+        if not candidates:
+            await message.answer("❌ Нет свободных специалистов на это время. Введите другую дату:")
+            return
+        if AUTO_ASSIGN:
+            best = candidates[0]
+            await assign_appointment(session, data['appointment_id'], best.specialist_id, date)
+            await message.answer(f"✅ Назначен специалист {best.name} ({best.username})")
+            await state.clear()
+            return
 
-        # Создаем кнопки
+        # Создаем кнопки, лучший кандидат первым
         keyboard = InlineKeyboardMarkup(inline_keyboard=[])
-        for spec in specialists:
+        for i, cand in enumerate(candidates):
             keyboard.inline_keyboard.append([
                 InlineKeyboardButton(
-                    text=f"{spec.name} ({spec.username})",
-                    callback_data=f"spec_{spec.id}"
+                    text=f"{'⭐ ' if i == 0 else ''}{cand.name} ({cand.username}) · записей: {cand.load}",
+                    callback_data=PickSpecialist(specialist_id=cand.specialist_id).pack()
                 )
             ])
 
@@ -204,200 +248,449 @@ async def process_date(message: types.Message, state: FSMContext):
         await message.answer("❌ Неверный формат даты. Используйте ДД.ММ.ГГГГ ЧЧ:ММ")
 
 
+# Назначение специалиста и уведомления
+async def assign_appointment(session: AsyncSession, appointment_id: int, specialist_id: int, date: datetime):
+    old = await stats.change_status(
+        session, appointment_id, StatusEnum.approved,
+        specialist_id=specialist_id,
+        date=date
+    )
+    await session.commit()
+    if old is None:
+        return
+    if old.status == StatusEnum.approved and old.specialist_id:
+        assigner.index.remove(old.specialist_id, old.date)
+    assigner.index.add(specialist_id, naive(date))
+    appointment = await get_appointment(session, appointment_id, 'task_card')
+    specialist = appointment.specialist
+
+    # Уведомление специалисту (исправленная версия)
+    outbox.send_message(
+        specialist.telegram_id,
+        f"📌 Новая задача!\n"
+        f"🗓 Дата: {appointment.date.astimezone(TIMEZONE).strftime('%d.%m.%Y %H:%M')}\n"
+        f"👤 Клиент: {appointment.client.name}\n"
+        f"📍 Город: {appointment.client.city}\n"
+        f"📱 Телефон: {appointment.client.phone}\n"
+        f"📦 Тип изделия: {appointment.client.product_type}\n"
+        f"🔢 Серийный номер: {appointment.client.serial_number}\n"
+        f"📝 Причина обращения:\n{appointment.description}"
+    )
+
+    # Уведомление клиенту с кнопками
+    outbox.send_message(
+        appointment.client.telegram_id,
+        f"✅ Ваша заявка одобрена!\n"
+        f"📅 Дата: {appointment.date.astimezone(TIMEZONE).strftime('%d.%m.%Y %H:%M')}\n"
+        f"👨💻 Специалист: {specialist.name}\n"
+        f"📎 Контакты: @{specialist.username}",
+        reply_markup=client_confirm_keyboard(appointment.id)
+    )
+
+
 # В обработчике process_specialist (полная версия)
-@dp.callback_query(F.data.startswith("spec_"))
-async def process_specialist(callback: types.CallbackQuery, state: FSMContext):
-    specialist_id = int(callback.data.split("_")[1])
+@dp.callback_query(Is(PickSpecialist))
+async def process_specialist(callback: types.CallbackQuery, callback_data: PickSpecialist, state: FSMContext, session: AsyncSession):
+    specialist_id = callback_data.specialist_id
     data = await state.get_data()
+    # The button outlives the admin's FSM data (restart, TTL, another flow)
+    if 'appointment_id' not in data or 'appointment_date' not in data:
+        await callback.answer("⚠️ Заявка устарела, откройте её заново", show_alert=True)
+        return
+    date = naive(datetime.fromisoformat(data['appointment_date']))
+    index = await assigner.read_index(session, date, specialist_id=specialist_id) if SHARED else assigner.index
+    if not index.is_free(specialist_id, date):
+        free_at = index.next_free(specialist_id, date)
+        await callback.answer(
+            f"❌ Специалист занят, ближайшее свободное время: {free_at.strftime('%d.%m.%Y %H:%M')}",
+            show_alert=True
+        )
+        return
 
     try:
-        async with AsyncSessionMaker() as session:
-            res = await session.execute(
-                select(Appointment)
-                .options(joinedload(Appointment.client))
-                .where(Appointment.id == data['appointment_id'])
-            )
-            appointment = res.scalar_one()
-
-            specialist = await session.get(Specialist, specialist_id)
-
-            # Уведомление специалисту (исправленная версия)
-            await bot.send_message(
-                specialist.telegram_id,
-                f"📌 Новая задача!\n"
-                f"🗓 Дата: {appointment.date.astimezone(TIMEZONE).strftime('%d.%m.%Y %H:%M')}\n"
-                f"👤 Клиент: {appointment.client.name}\n"
-                f"📍 Город: {appointment.client.city}\n"
-                f"📱 Телефон: {appointment.client.phone}\n"
-                f"📦 Тип изделия: {appointment.client.product_type}\n"
-                f"🔢 Серийный номер: {appointment.client.serial_number}\n"
-                f"📝 Причина обращения:\n{appointment.description}"
-            )
-
-            # Уведомление клиенту с кнопками
-            await bot.send_message(
-                appointment.client.telegram_id,
-                f"✅ Ваша заявка одобрена!\n"
-                f"📅 Дата: {appointment.date.astimezone(TIMEZONE).strftime('%d.%m.%Y %H:%M')}\n"
-                f"👨💻 Специалист: {specialist.name}\n"
-                f"📎 Контакты: @{specialist.username}",
-                reply_markup=client_confirm_keyboard(appointment.id)
-            )
-
+        await assign_appointment(
+            session, data['appointment_id'], specialist_id,
+            datetime.fromisoformat(data['appointment_date'])
+        )
     except Exception as e:
         logging.error(f"Ошибка: {str(e)}", exc_info=True)
 
 
-@dp.callback_query(F.data.startswith("cancel_"))
-async def cancel_appointment(callback: types.CallbackQuery):
-    appointment_id = int(callback.data.split("_")[1])
-    async with AsyncSessionMaker() as session:
-        await session.execute(
-            update(Appointment)
-            .where(Appointment.id == appointment_id)
-            .values(status=StatusEnum.canceled)
-        )
-        await session.commit()
+@dp.callback_query(Is(Cancel))
+async def cancel_appointment(callback: types.CallbackQuery, callback_data: Cancel, session: AsyncSession):
+    appointment_id = callback_data.appointment_id
+    old = await stats.change_status(session, appointment_id, StatusEnum.canceled)
+    await session.commit()
+    if old and old.status == StatusEnum.approved and old.specialist_id:
+        assigner.index.remove(old.specialist_id, old.date)
     await callback.message.edit_text("❌ Заявка отменена")
 
 # Show appointments
-@dp.message(F.text == '📋 Мои заявки')
-async def show_appointments(message: types.Message):
-    async with AsyncSessionMaker() as session:
-        res = await session.execute(
-            select(Client).where(Client.telegram_id == message.from_user.id)
-        )
-        client = res.scalar_one_or_none()
-        if not client:
-            await message.answer('Сначала зарегистрируйтесь.')
-            return
-        res = await session.execute(
-            select(Appointment).where(Appointment.client_id == client.id).order_by(Appointment.created_at.desc())
-        )
-        apps = res.scalars().all()
+async def render_appointments(session: AsyncSession, user_id: int, cursor: str = None, backward: bool = False):
+    client_id = await get_client_id(session, user_id)
+    if not client_id:
+        return 'Сначала зарегистрируйтесь.', None
+    apps, prev_cursor, next_cursor = await fetch_page(
+        session,
+        appointments('client_appointments').where(Appointment.client_id == client_id),
+        APPOINTMENTS_KEYSET, cursor, backward
+    )
     if not apps:
-        await message.answer('У вас нет активных заявок.')
-        return
+        return 'У вас нет активных заявок.', None
     text = 'Ваши заявки:\n\n'
     for app in apps:
         local_time = app.created_at.astimezone(TIMEZONE).strftime('%d.%m.%Y %H:%M')
         text += f'▫️ {local_time}\nСтатус: {app.status.value}\n\n'
-    await message.answer(text)
+    return text, pagination_keyboard('apps', prev_cursor, next_cursor)
+
+@dp.message(F.text == '📋 Мои заявки')
+async def show_appointments(message: types.Message, session: AsyncSession):
+    text, markup = await render_appointments(session, message.from_user.id)
+    await message.answer(text, reply_markup=markup)
 
 # Show stats
 @dp.message(F.text == '📊 Статистика')
-async def show_stats(message: types.Message):
+async def show_stats(message: types.Message, session: AsyncSession):
     if message.from_user.id != ADMIN_ID:
         return
-    async with AsyncSessionMaker() as session:
-        total_clients = await session.scalar(select(func.count(Client.id)))
-        active_apps = await session.scalar(
-            select(func.count(Appointment.id)).where(Appointment.status == StatusEnum.approved)
+    counters = await stats.load(session)
+    load = counters.get(stats.SPECIALIST, {})
+    names = {}
+    if load:
+        res = await session.execute(
+            select(Specialist.id, Specialist.name).where(Specialist.id.in_([int(k) for k in load]))
         )
-    await message.answer(f'📊 Статистика:\nКлиентов: {total_clients}\nАктивных заявок: {active_apps}')
+        names = {str(spec_id): name for spec_id, name in res.all()}
+    by_status = counters.get(stats.STATUS, {})
+    ratings = counters.get(stats.RATINGS, {})
+    avg_rating = ratings.get('sum', 0) / ratings['count'] if ratings.get('count') else 0
+    text = (
+        f'📊 Статистика:\n'
+        f'Клиентов: {counters.get(stats.CLIENTS, {}).get("total", 0)}\n'
+        f'Активных заявок: {by_status.get(StatusEnum.approved.value, 0)}\n'
+        f'Средний рейтинг клиентов: {avg_rating:.2f}\n'
+    )
+    text += '\nПо статусам:\n'
+    for status in StatusEnum:
+        text += f'▫️ {status.value}: {by_status.get(status.value, 0)}\n'
+    if load:
+        text += '\nНагрузка специалистов:\n'
+        for spec_id, count in sorted(load.items(), key=lambda item: -item[1]):
+            text += f'▫️ {names.get(spec_id, spec_id)}: {count}\n'
+    cities = sorted(counters.get(stats.CITY, {}).items(), key=lambda item: -item[1])[:10]
+    if cities:
+        text += '\nПо городам:\n'
+        for city, count in cities:
+            text += f'▫️ {city}: {count}\n'
+    days = sorted(counters.get(stats.DAY, {}).items())
+    if days:
+        text += '\nЗаявки по дням:\n'
+        for day, count in days:
+            text += f'▫️ {day}: {count}\n'
+    await message.answer(text)
 
 # Manage blacklist
-@dp.message(F.text == '🔨 ЧС')
-async def manage_blacklist(message: types.Message):
-    if message.from_user.id != ADMIN_ID:
-        return
-    async with AsyncSessionMaker() as session:
-        res = await session.execute(select(Blacklist))
-        entries = res.scalars().all()
+async def render_blacklist(session: AsyncSession, user_id: int, cursor: str = None, backward: bool = False):
+    if user_id != ADMIN_ID:
+        return None, None
+    entries, prev_cursor, next_cursor = await fetch_page(
+        session, select(Blacklist), BLACKLIST_KEYSET, cursor, backward
+    )
     if not entries:
-        await message.answer('Список пуст')
-        return
+        return 'Список пуст', None
     text = 'Черный список:\n'
     for entry in entries:
         until = entry.until.astimezone(TIMEZONE).strftime('%d.%m.%Y')
         text += f'ID {entry.client_id} до {until}\n'
-    await message.answer(text)
+    return text, pagination_keyboard('bl', prev_cursor, next_cursor)
+
+@dp.message(F.text == '🔨 ЧС')
+async def manage_blacklist(message: types.Message, session: AsyncSession):
+    text, markup = await render_blacklist(session, message.from_user.id)
+    if text:
+        await message.answer(text, reply_markup=markup)
 
 # Manage specialists
 @dp.message(F.text == '👥 Специалисты')
-async def manage_specialists(message: types.Message):
+async def manage_specialists(message: types.Message, session: AsyncSession):
     if message.from_user.id != ADMIN_ID:
         return
-    async with AsyncSessionMaker() as session:
-        res = await session.execute(select(Specialist))
-        specs = res.scalars().all()
+    res = await session.execute(select(Specialist).where(Specialist.is_active == True))
+    specs = res.scalars().all()
     if not specs:
         await message.answer('Нет специалистов')
         return
+    spec_ratings = await ratings.specialist_ratings(session, [spec.id for spec in specs])
     text = 'Специалисты:\n'
     for spec in specs:
         status = '🟢' if spec.is_available else '🔴'
-        text += f'▫️ {spec.name} ({spec.username}) - {status}\n'
+        count, avg = spec_ratings[spec.id]
+        text += f'▫️ {spec.name} ({spec.username}) - {status} ⭐ {avg:.2f} ({count})\n'
     await message.answer(text)
 
 # Toggle availability
 @dp.message(F.text == '✅ Готов к работе')
-async def toggle_availability(message: types.Message):
-    async with AsyncSessionMaker() as session:
-        res = await session.execute(
-            select(Specialist).where(Specialist.telegram_id == message.from_user.id)
-        )
-        spec = res.scalar_one_or_none()
-        if not spec:
-            return
-        now = datetime.now(pytz.utc)
-        recent = await session.scalar(
-            select(func.count(Appointment.id)).where(
-                Appointment.specialist_id == spec.id,
-                Appointment.status == StatusEnum.approved,
-                Appointment.date >= now - timedelta(minutes=30),
-                Appointment.date <= now + timedelta(hours=1)
-            )
+async def toggle_availability(message: types.Message, session: AsyncSession):
+    res = await session.execute(
+        select(Specialist).where(Specialist.telegram_id == message.from_user.id)
+    )
+    spec = res.scalar_one_or_none()
+    if not spec:
+        return
+    now = naive(datetime.now(TIMEZONE))
+    lo, hi = now - timedelta(minutes=30), now + timedelta(hours=1)
+    index = await assigner.read_index(session, lo, hi, spec.id) if SHARED else assigner.index
+    if not index.count_between(spec.id, lo, hi):
+        await message.answer('❌ Нет активных записей')
+        return
+    spec.is_available = not spec.is_available
+    await session.commit()
+    assigner.set_available(spec.id, spec.is_available)
+    status = '🟢 Доступен' if spec.is_available else '🔴 Занят'
+    await message.answer(status)
+
+# Close a finished visit by rating the client
+@dp.message(F.text == '📊 Отчеты')
+async def show_reports(message: types.Message, session: AsyncSession):
+    spec_id = await get_specialist_id(session, message.from_user.id)
+    if not spec_id:
+        return
+    count, avg = await ratings.specialist_rating(session, spec_id)
+    await message.answer(f'Выставлено оценок: {count}, средняя: {avg:.2f}\nВыгрузка ваших заявок: /export')
+    res = await session.execute(
+        appointments('schedule')
+        .where(
+            Appointment.specialist_id == spec_id,
+            Appointment.status == StatusEnum.approved,
+            Appointment.date <= naive(datetime.now(TIMEZONE))
         )
-        if not recent:
-            await message.answer('❌ Нет активных записей')
-            return
-        spec.is_available = not spec.is_available
+        .order_by(Appointment.date)
+        .limit(1)
+    )
+    app = res.scalar_one_or_none()
+    if not app:
+        await message.answer('Нет визитов, ожидающих оценки')
+        return
+    await message.answer(
+        f"Заявка #{app.id}, {app.date.strftime('%d.%m %H:%M')}, клиент {app.client.name}.\nОцените клиента:",
+        reply_markup=rating_keyboard(app.id)
+    )
+
+
+@dp.callback_query(Is(Rate))
+async def rate_client(callback: types.CallbackQuery, callback_data: Rate, state: FSMContext, session: AsyncSession):
+    spec_id = await get_specialist_id(session, callback.from_user.id)
+    if not spec_id or not 1 <= callback_data.score <= 5:
+        await callback.answer()
+        return
+    rating, old = await ratings.rate(session, callback_data.appointment_id, spec_id, callback_data.score)
+    if rating is None:
+        await callback.answer('Заявка уже закрыта', show_alert=True)
+        return
+    await session.commit()
+    # A closed visit no longer holds its slot, as in sharded mode's read_index (approved only)
+    assigner.index.remove(spec_id, old.date)
+    await state.update_data(rating_id=rating.id)
+    await state.set_state(SpecialistStates.rating_client)
+    await callback.message.edit_text(f'✅ Заявка #{callback_data.appointment_id} закрыта, оценка {callback_data.score}')
+    await callback.message.answer('Добавьте комментарий к оценке или отправьте «-»')
+
+
+@dp.message(SpecialistStates.rating_client)
+async def rating_comment(message: types.Message, state: FSMContext, session: AsyncSession):
+    data = await state.get_data()
+    if message.text and message.text != '-':
+        await session.execute(update(Rating).where(Rating.id == data['rating_id']).values(comment=message.text))
         await session.commit()
-        status = '🟢 Доступен' if spec.is_available else '🔴 Занят'
-        await message.answer(status)
+    await state.clear()
+    await message.answer('Спасибо!')
+
+# Export reports as a document: /export [appointments|clients] [csv|parquet]
+@dp.message(Command('export'))
+async def send_export(message: types.Message, command: CommandObject, session: AsyncSession):
+    args = (command.args or '').lower().split()
+    import export
+    fmt = next((arg for arg in args if arg in export.FORMATS), 'csv')
+    role = await get_user_role(session, message.from_user.id)
+    if role == 'admin':
+        report = 'clients' if 'clients' in args else 'appointments'
+        specialist_id = None
+    elif role == 'specialist':
+        report = 'appointments'
+        specialist_id = await get_specialist_id(session, message.from_user.id)
+    else:
+        return
+    await message.answer('⏳ Готовлю выгрузку...')
+    try:
+        path, count = await export.export(report, fmt, specialist_id)
+    except ImportError:
+        await message.answer('❌ Для parquet нужен пакет pyarrow')
+        return
+    try:
+        await message.answer_document(FSInputFile(path), caption=f'{report}: {count} строк')
+    finally:
+        os.remove(path)
+
+# Broadcast: filters on the command line, message text on the following lines
+# /broadcast city=Москва product=Станок serial=SN-0100..SN-0200
+@dp.message(Command('broadcast'))
+async def start_broadcast(message: types.Message, command: CommandObject, session: AsyncSession):
+    if message.from_user.id != ADMIN_ID:
+        return
+    header, _, text = (command.args or '').partition('\n')
+    text = text.strip()
+    if not text:
+        lines = ['Формат: /broadcast [city=..] [product=..] [serial=A..B], текст со следующей строки']
+        for item in await broadcast.recent(session):
+            lines.append(f'#{item.id} {item.status.value}: доставлено {item.sent}, ошибок {item.failed}')
+        await message.answer('\n'.join(lines))
+        return
+    item = await broadcast.create(session, text, broadcast.parse_filters(header.split()))
+    await session.commit()
+    broadcast.start(item.id)
+    await message.answer(f'📣 Рассылка #{item.id} запущена. Отмена: /broadcast_cancel {item.id}')
+
+
+@dp.message(Command('broadcast_cancel'))
+async def cancel_broadcast(message: types.Message, command: CommandObject, session: AsyncSession):
+    if message.from_user.id != ADMIN_ID or not (command.args or '').strip().isdigit():
+        return
+    canceled = await broadcast.cancel(session, int(command.args))
+    await session.commit()
+    await message.answer('❌ Рассылка отменена' if canceled else 'Рассылка не найдена или уже завершена')
+
+# Search clients and appointments: /search <serial, phone, name, city or description words>
+async def render_search(session: AsyncSession, query: str, offset: int = 0):
+    clients, apps, has_more = await search.search(session, query, offset)
+    if not clients and not apps:
+        return 'Ничего не найдено', None
+    text = f'🔍 {query}\n'
+    if clients:
+        text += '\nКлиенты:\n'
+        for client in clients:
+            text += f'▫️ {client.name}, {client.city}, {client.phone}, {client.product_type} {client.serial_number}\n'
+    if apps:
+        text += '\nЗаявки:\n'
+        for app in apps:
+            text += f'▫️ #{app.id} [{app.status.value}] {(app.description or "")[:80]}\n'
+    return text, search_keyboard(offset, has_more)
+
+
+@dp.message(Command('search'))
+async def search_handler(message: types.Message, command: CommandObject, state: FSMContext, session: AsyncSession):
+    if message.from_user.id != ADMIN_ID:
+        return
+    query = (command.args or '').strip()
+    if not search.terms(query):
+        await message.answer(f'Введите запрос не короче {search.MIN_TERM} символов: /search SN-0001')
+        return
+    await state.update_data(search_query=query)
+    text, markup = await render_search(session, query)
+    await message.answer(text, reply_markup=markup)
+
+
+@dp.callback_query(Is(SearchPage))
+async def search_page(callback: types.CallbackQuery, callback_data: SearchPage, state: FSMContext, session: AsyncSession):
+    query = (await state.get_data()).get('search_query')
+    if query and callback.from_user.id == ADMIN_ID:
+        text, markup = await render_search(session, query, callback_data.offset)
+        await callback.message.edit_text(text, reply_markup=markup)
+    await callback.answer()
 
 # Show schedule
-@dp.message(F.text == '📅 Расписание')
-async def show_schedule(message: types.Message):
-    async with AsyncSessionMaker() as session:
-        res = await session.execute(
-            select(Specialist).where(Specialist.telegram_id == message.from_user.id)
-        )
-        spec = res.scalar_one_or_none()
-        if not spec:
-            return
-        res = await session.execute(
-            select(Appointment).where(Appointment.specialist_id == spec.id).order_by(Appointment.date)
-        )
-        apps = res.scalars().all()
+async def render_schedule(session: AsyncSession, user_id: int, cursor: str = None, backward: bool = False):
+    spec_id = await get_specialist_id(session, user_id)
+    if not spec_id:
+        return None, None
+    apps, prev_cursor, next_cursor = await fetch_page(
+        session,
+        appointments('schedule').where(Appointment.specialist_id == spec_id),
+        SCHEDULE_KEYSET, cursor, backward
+    )
     if not apps:
-        await message.answer('Нет записей')
-        return
+        return 'Нет записей', None
     text = 'Расписание:\n'
     for app in apps:
         time_str = app.date.astimezone(TIMEZONE).strftime('%d.%m %H:%M')
         client_name = app.client.name
         text += f'▫️ {time_str} - {client_name}\n'
-    await message.answer(text)
+    return text, pagination_keyboard('sched', prev_cursor, next_cursor)
+
+@dp.message(F.text == '📅 Расписание')
+async def show_schedule(message: types.Message, session: AsyncSession):
+    text, markup = await render_schedule(session, message.from_user.id)
+    if text:
+        await message.answer(text, reply_markup=markup)
+
+# Page navigation
+PAGE_VIEWS = {
+    'apps': render_appointments,
+    'sched': render_schedule,
+    'bl': render_blacklist,
+}
+
+@dp.callback_query(Is(Page))
+async def paginate(callback: types.CallbackQuery, callback_data: Page, session: AsyncSession):
+    render = PAGE_VIEWS.get(callback_data.view)
+    if not render:
+        await callback.answer()
+        return
+    text, markup = await render(session, callback.from_user.id, callback_data.cursor, callback_data.backward)
+    if text:
+        await callback.message.edit_text(text, reply_markup=markup)
+    await callback.answer()
 
 # Startup
-async def on_startup():
-    await init_db()
+async def on_startup(bot: Bot):
+    global scheduler
+    # In sharded mode only shard 0 sets up the schema and runs jobs and broadcasts
+    primary = SHARD_INDEX == 0
+    if primary:
+        with metrics.startup_phase('migrate'):
+            await migrate()
     async with AsyncSessionMaker() as session:
-        for tg_id, data in SPECIALISTS.items():
-            res = await session.execute(
-                select(Specialist).where(Specialist.telegram_id == tg_id)
-            )
-            if not res.scalar_one_or_none():
-                session.add(Specialist(
-                    telegram_id=tg_id,
-                    name=data['name'],
-                    username=data['username']
-                ))
+        if primary:
+            with metrics.startup_phase('roster'):
+                synced, deactivated = await sync_specialists(session, load_roster())
+                logging.info(f"Специалисты: синхронизировано {synced}, отключено {deactivated}")
+                await session.commit()
+        with metrics.startup_phase('assigner'):
+            await assigner.load(session)
+        if primary:
+            with metrics.startup_phase('stats'):
+                if await stats.is_empty(session):
+                    await stats.rebuild(session)
         await session.commit()
-    scheduler.start()
+    role_cache.clear()
+    metrics.instrument_bot(bot)
+    with metrics.startup_phase('services'):
+        if METRICS_PORT:
+            await metrics.start_server(METRICS_HOST, METRICS_PORT + SHARD_INDEX)
+        await outbox.start(bot)
+        if primary:
+            await broadcast.resume()
+            scheduler = create_scheduler()
+            scheduler.start(paused=True)
+            register_jobs(scheduler)
+            scheduler.resume()
+
+# Shutdown
+async def on_shutdown():
+    if scheduler and scheduler.running:
+        scheduler.shutdown(wait=False)
+    await broadcast.stop()
+    await outbox.stop()
+    await metrics.stop_server()
 
 if __name__ == '__main__':
     dp.startup.register(on_startup)
-    dp.run_polling(bot)
+    dp.shutdown.register(on_shutdown)
+    if MODE == 'webhook':
+        from webhook import run_webhook
+        run_webhook(dp, bot)
+    elif MODE == 'sharded':
+        # Workers re-import the main module, so the supervisor runs from sharding.py
+        # instead of this file; otherwise each worker would load the bot before its config overrides
+        os.execv(sys.executable, [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sharding.py')])
+    else:
+        dp.run_polling(bot)
@@ -0,0 +1,159 @@
+#broadcast.py
+import asyncio
+import json
+import logging
+from datetime import datetime
+import pytz
+from sqlalchemy import select, update, exists, or_
+from config import ADMIN_ID, BROADCAST_BATCH
+from database import (AsyncSessionMaker, Broadcast, BroadcastDelivery, BroadcastStatus, Blacklist, Client,
+                      ClientStatus, dialect_insert)
+from outbox import outbox
+
+# Running broadcasts by id
+_tasks = {}
+_stopping = asyncio.Event()
+
+
+# `city=Москва product=Станок serial=SN-0100..SN-0200`; serial bounds compare as strings
+def parse_filters(tokens):
+    filters = {}
+    for token in tokens:
+        key, sep, value = token.partition('=')
+        if not sep or not value:
+            continue
+        if key == 'serial':
+            low, _, high = value.partition('..')
+            filters['serial_from'], filters['serial_to'] = low or None, high or None
+        elif key in ('city', 'product'):
+            filters[key] = value
+    return filters
+
+
+# Next page of recipients after `after`, skipping anyone already recorded for this broadcast
+def recipients(broadcast_id: int, filters: dict, after: int, limit: int):
+    now = datetime.now(pytz.utc).replace(tzinfo=None)
+    stmt = (
+        select(Client.id, Client.telegram_id)
+        .where(
+            Client.id > after,
+            Client.telegram_id.isnot(None),
+            or_(Client.status == ClientStatus.active, Client.status.is_(None)),
+            ~exists().where(BroadcastDelivery.broadcast_id == broadcast_id, BroadcastDelivery.client_id == Client.id),
+            ~exists().where(Blacklist.client_id == Client.id, Blacklist.until > now),
+        )
+        .order_by(Client.id)
+        .limit(limit)
+    )
+    if filters.get('city'):
+        stmt = stmt.where(Client.city == filters['city'])
+    if filters.get('product'):
+        stmt = stmt.where(Client.product_type == filters['product'])
+    if filters.get('serial_from'):
+        stmt = stmt.where(Client.serial_number >= filters['serial_from'])
+    if filters.get('serial_to'):
+        stmt = stmt.where(Client.serial_number <= filters['serial_to'])
+    return stmt
+
+
+async def create(session, text: str, filters: dict):
+    broadcast = Broadcast(text=text, filters=json.dumps(filters, ensure_ascii=False), status=BroadcastStatus.running)
+    session.add(broadcast)
+    await session.flush()
+    return broadcast
+
+
+# Sends page by page through the outbox. Only BROADCAST_BATCH messages are in flight, and each
+# page's delivery states and cursor are committed together, so a stop or crash resumes at the
+# first unrecorded page.
+async def run(broadcast_id: int, batch: int = BROADCAST_BATCH):
+    async with AsyncSessionMaker() as session:
+        broadcast = await session.get(Broadcast, broadcast_id)
+        filters = json.loads(broadcast.filters or '{}')
+        cursor = broadcast.cursor or 0
+        while True:
+            if _stopping.is_set():
+                return
+            status = await session.scalar(select(Broadcast.status).where(Broadcast.id == broadcast_id))
+            if status != BroadcastStatus.running:
+                return
+            rows = (await session.execute(recipients(broadcast_id, filters, cursor, batch))).all()
+            if not rows:
+                break
+            # Don't hold a read transaction open while the page is being sent
+            await session.commit()
+            results = await asyncio.gather(*(outbox.send_message(tg_id, broadcast.text) for _, tg_id in rows))
+            sent = sum(result is not None for result in results)
+            await session.execute(
+                dialect_insert(BroadcastDelivery).on_conflict_do_nothing(),
+                [{'broadcast_id': broadcast_id, 'client_id': client_id, 'delivered': result is not None}
+                 for (client_id, _), result in zip(rows, results)]
+            )
+            cursor = rows[-1][0]
+            await session.execute(
+                update(Broadcast)
+                .where(Broadcast.id == broadcast_id)
+                .values(cursor=cursor, sent=Broadcast.sent + sent, failed=Broadcast.failed + len(rows) - sent)
+            )
+            await session.commit()
+        await session.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id)
+            .values(status=BroadcastStatus.done, finished_at=datetime.now())
+        )
+        await session.commit()
+        await session.refresh(broadcast)
+    logging.info(f"Рассылка #{broadcast_id} завершена: доставлено {broadcast.sent}, ошибок {broadcast.failed}")
+    outbox.send_message(
+        ADMIN_ID, f"📣 Рассылка #{broadcast_id} завершена: доставлено {broadcast.sent}, ошибок {broadcast.failed}"
+    )
+
+
+def _finished(broadcast_id: int, task):
+    _tasks.pop(broadcast_id, None)
+    if not task.cancelled() and task.exception():
+        logging.error(f"Рассылка #{broadcast_id}: {task.exception()}")
+
+
+def start(broadcast_id: int):
+    if broadcast_id in _tasks:
+        return
+    task = asyncio.create_task(run(broadcast_id))
+    _tasks[broadcast_id] = task
+    task.add_done_callback(lambda task: _finished(broadcast_id, task))
+
+
+async def cancel(session, broadcast_id: int):
+    res = await session.execute(
+        update(Broadcast)
+        .where(Broadcast.id == broadcast_id, Broadcast.status == BroadcastStatus.running)
+        .values(status=BroadcastStatus.canceled, finished_at=datetime.now())
+    )
+    return bool(res.rowcount)
+
+
+async def recent(session, limit: int = 5):
+    res = await session.execute(select(Broadcast).order_by(Broadcast.id.desc()).limit(limit))
+    return res.scalars().all()
+
+
+# Restart broadcasts interrupted by a restart
+async def resume():
+    _stopping.clear()
+    async with AsyncSessionMaker() as session:
+        ids = (await session.scalars(select(Broadcast.id).where(Broadcast.status == BroadcastStatus.running))).all()
+    for broadcast_id in ids:
+        logging.info(f"Возобновляем рассылку #{broadcast_id}")
+        start(broadcast_id)
+
+
+# Let running broadcasts record their current page, then cancel whatever is left
+async def stop(timeout: float = 15):
+    _stopping.set()
+    tasks = list(_tasks.values())
+    if not tasks:
+        return
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
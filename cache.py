@@ -0,0 +1,56 @@
+#cache.py
+import time
+from collections import OrderedDict
+from config import ROLE_CACHE_SIZE, ROLE_CACHE_TTL
+
+MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 10000, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=MISSING):
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        value, expires = item
+        if expires < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses}
+
+
+# Role and blacklist resolution, keyed by telegram_id
+role_cache = TTLCache(ROLE_CACHE_SIZE, ROLE_CACHE_TTL)
+
+# Per-specialist (count, average) rating rollup, keyed by specialist id
+rating_cache = TTLCache(ROLE_CACHE_SIZE, ROLE_CACHE_TTL)
+
+
+def invalidate_user(user_id: int):
+    role_cache.invalidate(('role', user_id))
+    role_cache.invalidate(('blacklist', user_id))
@@ -0,0 +1,75 @@
+#callbacks.py
+from aiogram.filters import Filter
+from aiogram.filters.callback_data import CallbackData
+
+
+# Short prefixes keep even 64-bit ids and pagination cursors far below the 64-byte limit
+class Confirm(CallbackData, prefix="c"):
+    appointment_id: int
+
+
+class Cancel(CallbackData, prefix="x"):
+    appointment_id: int
+
+
+class PickSpecialist(CallbackData, prefix="s"):
+    specialist_id: int
+
+
+class Rate(CallbackData, prefix="r"):
+    score: int
+    appointment_id: int
+
+
+class ClientConfirm(CallbackData, prefix="cc"):
+    appointment_id: int
+
+
+class ClientDecline(CallbackData, prefix="cd"):
+    appointment_id: int
+
+
+class Page(CallbackData, prefix="pg"):
+    view: str
+    backward: bool
+    cursor: str
+
+
+# The query itself stays in FSM data, it may not fit in 64 bytes
+class SearchPage(CallbackData, prefix="q"):
+    offset: int
+
+
+CODECS = {cls.__prefix__: cls for cls in (Confirm, Cancel, PickSpecialist, Rate, ClientConfirm, ClientDecline, Page, SearchPage)}
+
+# Buttons already sent in the old `name_id` format
+LEGACY = {'confirm': Confirm, 'cancel': Cancel}
+
+
+def prefix(cls, *values):
+    # Packed form of the leading fields, for keyboard templates that append the id
+    return cls.__separator__.join([cls.__prefix__, *map(str, values), ''])
+
+
+def decode(data: str):
+    if not data:
+        return None
+    try:
+        cls = CODECS.get(data.split(':', 1)[0])
+        if cls:
+            return cls.unpack(data)
+        name, _, value = data.rpartition('_')
+        if name in LEGACY:
+            return LEGACY[name](**{next(iter(LEGACY[name].model_fields)): int(value)})
+    except (ValueError, TypeError):
+        pass
+    return None
+
+
+# Matches the callback_data decoded once by CallbackDataMiddleware
+class Is(Filter):
+    def __init__(self, cls):
+        self.cls = cls
+
+    async def __call__(self, callback, callback_data=None):
+        return isinstance(callback_data, self.cls)
@@ -1,11 +1,67 @@
 import pytz
 
-API_TOKEN = "7945563947k"
+API_TOKEN = "123456789:REPLACE_WITH_BOT_TOKEN"  # placeholder, set the real token from @BotFather
 ADMIN_ID = 123456789
 SPECIALISTS = {
-    : {"name": "Специалист 1", "username": "@tech_support1"},
-    : {"name": "Специалист 2", "username": "@tech_support2"}
+    111111111: {"name": "Специалист 1", "username": "@tech_support1"},
+    222222222: {"name": "Специалист 2", "username": "@tech_support2"}
 }
 TIMEZONE = pytz.timezone('Europe/Moscow')
 DB_URL = "sqlite+aiosqlite:///database.db"
 CODEWORD = "SECURE123"
+ROLE_CACHE_SIZE = 10000
+ROLE_CACHE_TTL = 300
+# FSM storage: memory, sqlite or redis
+FSM_STORAGE = "memory"
+FSM_SQLITE_PATH = "fsm.db"
+FSM_FLUSH_INTERVAL = 0.5
+FSM_CACHE_TTL = 1.0  # seconds a sqlite FSM entry is served from memory before it is read again
+REDIS_URL = "redis://localhost:6379/0"
+# Outbound message queue
+OUTBOX_WORKERS = 4
+OUTBOX_GLOBAL_RATE = 30
+OUTBOX_CHAT_RATE = 1
+OUTBOX_MAX_RETRIES = 3
+PAGE_SIZE = 10
+# Update delivery: polling or webhook
+MODE = "polling"  # polling, webhook or sharded
+# Bot API base URL override, e.g. a local Bot API server or a test stand-in
+API_SERVER = None
+WEBHOOK_URL = "https://example.com"
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_HOST = "0.0.0.0"
+WEBHOOK_PORT = 8080
+WEBHOOK_SECRET = ""
+WEBHOOK_MAX_CONCURRENCY = 100
+# Database engine (pool settings apply to Postgres)
+DB_POOL_SIZE = 10
+DB_MAX_OVERFLOW = 20
+DB_POOL_RECYCLE = 1800
+SQL_LOG_LEVEL = "WARNING"
+# Scheduled jobs
+JOBSTORE_URL = "sqlite:///jobs.db"
+REMINDER_AHEAD_MINUTES = 60
+REMINDER_INTERVAL_MINUTES = 5
+PENDING_EXPIRE_HOURS = 72
+CLEANUP_INTERVAL_MINUTES = 60
+# Prometheus text endpoint, None disables it
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9100
+# Specialist roster file (.csv or .json), None uses SPECIALISTS
+ROSTER_PATH = None
+# Specialist assignment
+SLOT_MINUTES = 60
+ASSIGN_LOAD_WINDOW_HOURS = 24
+AUTO_ASSIGN = False
+# Ratings
+RATING_RECOMPUTE_HOURS = 24
+RATING_CHUNK = 1000
+# Exports
+EXPORT_CHUNK = 1000
+EXPORT_DIR = None  # None: system temp dir
+# Broadcasts
+BROADCAST_BATCH = 200  # recipients queued to the outbox at a time
+# Sharded mode (MODE = "sharded"), see sharding.py
+SHARDS = 4
+SHARD_INDEX = 0  # set per worker process
+SHARD_QUEUE_SIZE = 10000
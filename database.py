@@ -1,15 +1,40 @@
 #database.py
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Boolean, Float
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Boolean, Float, Index, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects import postgresql, sqlite
 import enum
+import logging
 from datetime import datetime
-from config import DB_URL
+from config import DB_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, SQL_LOG_LEVEL
 
 Base = declarative_base()
-engine = create_async_engine(DB_URL, echo=True)
+
+# Engine tuning per backend
+def _engine_options(url: str):
+    if url.startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_pre_ping': True,
+        'pool_recycle': DB_POOL_RECYCLE,
+    }
+
+engine = create_async_engine(DB_URL, **_engine_options(DB_URL))
+logging.getLogger('sqlalchemy.engine').setLevel(SQL_LOG_LEVEL)
+
+if engine.dialect.name == 'sqlite':
+    @event.listens_for(engine.sync_engine, 'connect')
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA busy_timeout=5000')
+        cursor.close()
+
 AsyncSessionMaker = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
 class StatusEnum(enum.Enum):
@@ -43,8 +68,13 @@ class Specialist(Base):
     telegram_id = Column(Integer, unique=True)
     name = Column(String)
     username = Column(String)
+    city = Column(String)
     is_available = Column(Boolean, default=True)
+    is_active = Column(Boolean, default=True)
     appointments = relationship("Appointment", back_populates="specialist")
+    __table_args__ = (
+        Index('ix_specialists_is_available', 'is_available'),
+    )
 
 class Appointment(Base):
     __tablename__ = 'appointments'
@@ -58,8 +88,19 @@ class Appointment(Base):
     client_approved = Column(Boolean)
     specialist_approved = Column(Boolean)
     decline_reason = Column(String)
+    reminded_at = Column(DateTime)
     client = relationship("Client", back_populates="appointments")
     specialist = relationship("Specialist", back_populates="appointments")
+    __table_args__ = (
+        # start_handler, toggle_availability
+        Index('ix_appointments_specialist_status_date', 'specialist_id', 'status', 'date'),
+        # show_schedule
+        Index('ix_appointments_specialist_date', 'specialist_id', 'date'),
+        # show_appointments
+        Index('ix_appointments_client_created', 'client_id', 'created_at'),
+        # show_stats
+        Index('ix_appointments_status_date', 'status', 'date'),
+    )
 
 class Blacklist(Base):
     __tablename__ = 'blacklist'
@@ -67,6 +108,9 @@ class Blacklist(Base):
     client_id = Column(Integer, ForeignKey('clients.id'))
     until = Column(DateTime)
     created_at = Column(DateTime, default=datetime.now)
+    __table_args__ = (
+        Index('ix_blacklist_client_id', 'client_id'),
+    )
 
 class Rating(Base):
     __tablename__ = 'ratings'
@@ -76,7 +120,58 @@ class Rating(Base):
     score = Column(Integer)
     comment = Column(String)
     created_at = Column(DateTime, default=datetime.now)
+    __table_args__ = (
+        Index('ix_ratings_client_id', 'client_id'),
+        Index('ix_ratings_specialist_id', 'specialist_id'),
+    )
+
+# Applied schema migrations, see migrations.py
+class SchemaVersion(Base):
+    __tablename__ = 'schema_version'
+    version = Column(Integer, primary_key=True)
+    applied_at = Column(DateTime, default=datetime.now)
+
+# Materialized counters for the admin dashboard, see stats.py
+class StatCounter(Base):
+    __tablename__ = 'stat_counters'
+    name = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    value = Column(Integer, default=0)
+
+class BroadcastStatus(enum.Enum):
+    running = "running"
+    done = "done"
+    canceled = "canceled"
+
+# Mass notification; `cursor` is the last client id whose page is fully recorded, see broadcast.py
+class Broadcast(Base):
+    __tablename__ = 'broadcasts'
+    id = Column(Integer, primary_key=True)
+    text = Column(String)
+    filters = Column(String)
+    status = Column(Enum(BroadcastStatus), default=BroadcastStatus.running)
+    cursor = Column(Integer, default=0)
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.now)
+    finished_at = Column(DateTime)
+
+# Per-recipient delivery state, so a resumed broadcast never sends twice to a recorded client
+class BroadcastDelivery(Base):
+    __tablename__ = 'broadcast_deliveries'
+    broadcast_id = Column(Integer, ForeignKey('broadcasts.id'), primary_key=True)
+    client_id = Column(Integer, ForeignKey('clients.id'), primary_key=True)
+    delivered = Column(Boolean)
+    created_at = Column(DateTime, default=datetime.now)
+
+def dialect_insert(table):
+    # INSERT that supports on_conflict_do_update() on the configured backend
+    if engine.dialect.name == 'postgresql':
+        return postgresql.insert(table)
+    return sqlite.insert(table)
 
-async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+def create_indexes(sync_conn):
+    # create_all skips tables that already exist, so add new indexes explicitly
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
@@ -0,0 +1,126 @@
+#export.py
+import asyncio
+import csv
+import enum
+import os
+import tempfile
+from datetime import datetime
+from sqlalchemy import create_engine, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import aliased
+from config import DB_URL, EXPORT_CHUNK, EXPORT_DIR
+from database import Appointment, Client, Specialist
+
+# Exports read through their own synchronous engine in a worker thread,
+# streaming EXPORT_CHUNK rows at a time so memory stays flat and the event loop stays free.
+SYNC_DRIVERS = {'sqlite+aiosqlite': 'sqlite', 'postgresql+asyncpg': 'postgresql+psycopg2'}
+FORMATS = ('csv', 'parquet')
+
+_engine = None
+
+
+def sync_engine():
+    global _engine
+    if _engine is None:
+        url = make_url(DB_URL)
+        _engine = create_engine(url.set(drivername=SYNC_DRIVERS.get(url.drivername, url.drivername)))
+    return _engine
+
+
+# (header, column, parquet type) per report, with the streaming select and the specialist alias
+def appointment_columns():
+    spec = aliased(Specialist)
+    columns = [
+        ('id', Appointment.id, 'int'),
+        ('created_at', Appointment.created_at, 'datetime'),
+        ('date', Appointment.date, 'datetime'),
+        ('status', Appointment.status, 'str'),
+        ('description', Appointment.description, 'str'),
+        ('decline_reason', Appointment.decline_reason, 'str'),
+        ('client', Client.name, 'str'),
+        ('city', Client.city, 'str'),
+        ('phone', Client.phone, 'str'),
+        ('product_type', Client.product_type, 'str'),
+        ('serial_number', Client.serial_number, 'str'),
+        ('specialist', spec.name, 'str'),
+        ('specialist_username', spec.username, 'str'),
+    ]
+    stmt = (
+        select(*[column for _, column, _ in columns])
+        .join(Client, Appointment.client_id == Client.id)
+        .outerjoin(spec, Appointment.specialist_id == spec.id)
+        .order_by(Appointment.id)
+    )
+    return columns, stmt, spec
+
+
+def client_columns():
+    columns = [
+        ('id', Client.id, 'int'),
+        ('name', Client.name, 'str'),
+        ('city', Client.city, 'str'),
+        ('workplace', Client.workplace, 'str'),
+        ('product_type', Client.product_type, 'str'),
+        ('serial_number', Client.serial_number, 'str'),
+        ('phone', Client.phone, 'str'),
+        ('status', Client.status, 'str'),
+        ('rating', Client.rating, 'float'),
+        ('ratings_count', Client.ratings_count, 'int'),
+    ]
+    return columns, select(*[column for _, column, _ in columns]).order_by(Client.id), None
+
+
+def _value(value):
+    return value.value if isinstance(value, enum.Enum) else value
+
+
+def _write_csv(path, headers, partitions):
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(headers)
+        for rows in partitions:
+            writer.writerows([[_value(value) for value in row] for row in rows])
+            count += len(rows)
+    return count
+
+
+def _write_parquet(path, columns, partitions):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    types = {'int': pa.int64(), 'float': pa.float64(), 'datetime': pa.timestamp('us'), 'str': pa.string()}
+    schema = pa.schema([(header, types[kind]) for header, _, kind in columns])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        # One row group per chunk
+        for rows in partitions:
+            data = [[_value(row[i]) for row in rows] for i in range(len(columns))]
+            writer.write_table(pa.Table.from_arrays(data, schema=schema))
+            count += len(rows)
+    return count
+
+
+def write_report(report: str, fmt: str, specialist_id: int = None):
+    columns, stmt, spec = appointment_columns() if report == 'appointments' else client_columns()
+    if specialist_id is not None:
+        stmt = stmt.where(spec.id == specialist_id)
+    fd, path = tempfile.mkstemp(
+        prefix=f"{report}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_", suffix=f'.{fmt}', dir=EXPORT_DIR
+    )
+    os.close(fd)
+    try:
+        with sync_engine().connect() as conn:
+            result = conn.execution_options(yield_per=EXPORT_CHUNK).execute(stmt)
+            if fmt == 'parquet':
+                count = _write_parquet(path, columns, result.partitions())
+            else:
+                count = _write_csv(path, [header for header, _, _ in columns], result.partitions())
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, count
+
+
+# Returns (path, row count); the caller sends the file and removes it
+async def export(report: str, fmt: str = 'csv', specialist_id: int = None):
+    return await asyncio.to_thread(write_report, report, fmt, specialist_id)
@@ -0,0 +1,132 @@
+#jobs.py
+import functools
+import logging
+import time
+from datetime import datetime, timedelta
+import pytz
+from sqlalchemy import select, update, delete
+from sqlalchemy.orm import aliased
+from config import (TIMEZONE, JOBSTORE_URL, REMINDER_AHEAD_MINUTES, REMINDER_INTERVAL_MINUTES,
+                    PENDING_EXPIRE_HOURS, CLEANUP_INTERVAL_MINUTES, RATING_RECOMPUTE_HOURS)
+from database import AsyncSessionMaker, Appointment, Blacklist, Client, Specialist, StatusEnum
+from outbox import outbox
+import ratings
+import stats
+
+# Run durations per job: runs, last, max and total seconds
+job_stats = {}
+
+
+def timed_job(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            entry = job_stats.setdefault(func.__name__, {'runs': 0, 'last': 0.0, 'max': 0.0, 'total': 0.0})
+            entry['runs'] += 1
+            entry['last'] = elapsed
+            entry['max'] = max(entry['max'], elapsed)
+            entry['total'] += elapsed
+            logging.info(f"Задача {func.__name__} выполнена за {elapsed:.3f} с")
+    return wrapper
+
+
+# Batched reminders for approved appointments starting soon
+@timed_job
+async def send_reminders():
+    now = datetime.now(TIMEZONE).replace(tzinfo=None)
+    spec = aliased(Specialist)
+    async with AsyncSessionMaker() as session:
+        res = await session.execute(
+            select(Appointment.id, Appointment.date, Client.telegram_id, Client.name,
+                   spec.telegram_id, spec.name, spec.username)
+            .join(Client, Appointment.client_id == Client.id)
+            .join(spec, Appointment.specialist_id == spec.id)
+            .where(
+                Appointment.status == StatusEnum.approved,
+                Appointment.date >= now,
+                Appointment.date <= now + timedelta(minutes=REMINDER_AHEAD_MINUTES),
+                Appointment.reminded_at.is_(None)
+            )
+        )
+        rows = res.all()
+        if not rows:
+            return
+        for app_id, date, client_tg, client_name, spec_tg, spec_name, spec_username in rows:
+            time_str = date.strftime('%d.%m.%Y %H:%M')
+            outbox.send_message(client_tg, f"⏰ Напоминание: визит специалиста {spec_name} ({spec_username}) {time_str}")
+            outbox.send_message(spec_tg, f"⏰ Напоминание: заявка #{app_id}, клиент {client_name}, {time_str}")
+        await session.execute(
+            update(Appointment)
+            .where(Appointment.id.in_([row[0] for row in rows]))
+            .values(reminded_at=datetime.now(pytz.utc))
+        )
+        await session.commit()
+
+
+# Cancel pending appointments nobody processed in time
+@timed_job
+async def expire_pending():
+    cutoff = datetime.now(pytz.utc).replace(tzinfo=None) - timedelta(hours=PENDING_EXPIRE_HOURS)
+    async with AsyncSessionMaker() as session:
+        res = await session.execute(
+            update(Appointment)
+            .where(Appointment.status == StatusEnum.pending, Appointment.created_at < cutoff)
+            .values(status=StatusEnum.canceled, decline_reason='expired')
+        )
+        if res.rowcount:
+            await stats.bump(session, stats.STATUS, StatusEnum.pending.value, -res.rowcount)
+            await stats.bump(session, stats.STATUS, StatusEnum.canceled.value, res.rowcount)
+            logging.info(f"Просрочено заявок: {res.rowcount}")
+        await session.commit()
+
+
+@timed_job
+async def purge_blacklist():
+    now = datetime.now(pytz.utc).replace(tzinfo=None)
+    async with AsyncSessionMaker() as session:
+        res = await session.execute(delete(Blacklist).where(Blacklist.until < now))
+        await session.commit()
+    if res.rowcount:
+        logging.info(f"Удалено из ЧС: {res.rowcount}")
+
+
+# Rebuild rating aggregates from the Rating table
+@timed_job
+async def recompute_ratings():
+    async with AsyncSessionMaker() as session:
+        updated = await ratings.recompute(session)
+    logging.info(f"Пересчитаны рейтинги клиентов: {updated}")
+
+
+def create_scheduler():
+    # Imported here: only the process that runs jobs pays for APScheduler
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+    return AsyncIOScheduler(
+        jobstores={'default': SQLAlchemyJobStore(url=JOBSTORE_URL)},
+        # A run that fell due while the bot was down is made up once on boot
+        job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': None},
+        timezone=TIMEZONE
+    )
+
+
+# The scheduler must already be started (paused) so the persistent store is readable.
+# Stored jobs keep their next run time: re-adding them on every boot would push each run
+# back by a full interval, and a bot restarted daily would never recompute ratings.
+def register_jobs(scheduler):
+    intervals = (
+        (send_reminders, {'minutes': REMINDER_INTERVAL_MINUTES}),
+        (expire_pending, {'minutes': CLEANUP_INTERVAL_MINUTES}),
+        (purge_blacklist, {'minutes': CLEANUP_INTERVAL_MINUTES}),
+        (recompute_ratings, {'hours': RATING_RECOMPUTE_HOURS}),
+    )
+    for func, interval in intervals:
+        job = scheduler.get_job(func.__name__)
+        if job is None:
+            scheduler.add_job(func, 'interval', id=func.__name__, **interval)
+        elif job.trigger.interval != timedelta(**interval):
+            scheduler.reschedule_job(job.id, trigger='interval', **interval)
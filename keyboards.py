@@ -1,73 +1,105 @@
 #keyboards.py
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from config import PAGE_SIZE
+from callbacks import Confirm, Cancel, Rate, ClientConfirm, ClientDecline, Page, SearchPage, prefix
 
-def client_main_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="📝 Новая заявка")],
-            [KeyboardButton(text="📋 Мои заявки")]
-        ],
-        resize_keyboard=True,
-        persistent=True
-    )
+# Telegram types are frozen pydantic models, so static keyboards are built once and shared.
+# Per-appointment keyboards are stamped from validated templates whose callback_data is
+# the packed prefix; model_copy skips re-validation and is several times cheaper than construction.
 
-def admin_main_keyboard():
+
+def _reply(rows):
     return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="📊 Статистика"), KeyboardButton(text="📅 Записи")],
-            [KeyboardButton(text="🔨 ЧС"), KeyboardButton(text="👥 Специалисты")]
-        ],
+        keyboard=[[KeyboardButton(text=text) for text in row] for row in rows],
         resize_keyboard=True,
         persistent=True
     )
-def confirmation_keyboard(appointment_id: int):
+
+
+def _template(rows):
     return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text="✅ Подтвердить",
-                    callback_data=f"confirm_{appointment_id}"
-                ),
-                InlineKeyboardButton(
-                    text="❌ Отменить",
-                    callback_data=f"cancel_{appointment_id}"
-                )
-            ]
-        ]
+        inline_keyboard=[[InlineKeyboardButton(text=text, callback_data=prefix) for text, prefix in row] for row in rows]
     )
+
+
+def _stamp(template: InlineKeyboardMarkup, appointment_id: int):
+    return template.model_copy(update={'inline_keyboard': [
+        [button.model_copy(update={'callback_data': f"{button.callback_data}{appointment_id}"}) for button in row]
+        for row in template.inline_keyboard
+    ]})
+
+CLIENT_MAIN = _reply([
+    ["📝 Новая заявка"],
+    ["📋 Мои заявки"]
+])
+ADMIN_MAIN = _reply([
+    ["📊 Статистика", "📅 Записи"],
+    ["🔨 ЧС", "👥 Специалисты"]
+])
+SPECIALIST_MAIN = _reply([
+    ["📅 Расписание", "📊 Отчеты"]
+])
+SPECIALIST_MAIN_READY = _reply([
+    ["✅ Готов к работе"],
+    ["📅 Расписание", "📊 Отчеты"]
+])
+
+STATIC = {id(markup): markup for markup in (CLIENT_MAIN, ADMIN_MAIN, SPECIALIST_MAIN, SPECIALIST_MAIN_READY)}
+
+CONFIRMATION = _template([[("✅ Подтвердить", prefix(Confirm)), ("❌ Отменить", prefix(Cancel))]])
+RATING = _template([[(str(i), prefix(Rate, i)) for i in range(1, 6)]])
+CLIENT_CONFIRM = _template([[("✅ Подтвердить", prefix(ClientConfirm)), ("❌ Отказаться", prefix(ClientDecline))]])
+
+
+# Serializing a markup costs more than building it, so static ones are dumped once per session
+class KeyboardSession(AiohttpSession):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._markup_json = {}
+
+    def prepare_value(self, value, bot, files, _dumps_json=True):
+        if _dumps_json and id(value) in STATIC:
+            if id(value) not in self._markup_json:
+                self._markup_json[id(value)] = super().prepare_value(value, bot, files)
+            return self._markup_json[id(value)]
+        return super().prepare_value(value, bot, files, _dumps_json)
+
+
+def client_main_keyboard():
+    return CLIENT_MAIN
+
+def admin_main_keyboard():
+    return ADMIN_MAIN
+
 def specialist_main_keyboard(has_appointments: bool = False):
-    keyboard = [
-        [KeyboardButton(text="📅 Расписание"), KeyboardButton(text="📊 Отчеты")]
-    ]
-    if has_appointments:
-        keyboard.insert(0, [KeyboardButton(text="✅ Готов к работе")])
-    return ReplyKeyboardMarkup(
-        keyboard=keyboard,
-        resize_keyboard=True,
-        persistent=True
-    )
+    return SPECIALIST_MAIN_READY if has_appointments else SPECIALIST_MAIN
 
 def confirmation_keyboard(appointment_id: int):
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="✅ Подтвердить", callback_data=f"confirm_{appointment_id}"),
-             InlineKeyboardButton(text="❌ Отменить", callback_data=f"cancel_{appointment_id}")]
-        ]
-    )
+    return _stamp(CONFIRMATION, appointment_id)
 
 def rating_keyboard(appointment_id: int):
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text=str(i), callback_data=f"rate_{i}_{appointment_id}") for i in range(1, 6)]
-        ]
-    )
+    return _stamp(RATING, appointment_id)
 
 def client_confirm_keyboard(appointment_id: int):
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="✅ Подтвердить", callback_data=f"client_confirm_{appointment_id}"),
-                InlineKeyboardButton(text="❌ Отказаться", callback_data=f"client_decline_{appointment_id}")
-            ]
-        ]
-    )
+    return _stamp(CLIENT_CONFIRM, appointment_id)
+
+def pagination_keyboard(view: str, prev_cursor: str = None, next_cursor: str = None):
+    buttons = []
+    if prev_cursor:
+        buttons.append(InlineKeyboardButton(text="◀️ Назад", callback_data=Page(view=view, backward=True, cursor=prev_cursor).pack()))
+    if next_cursor:
+        buttons.append(InlineKeyboardButton(text="Вперед ▶️", callback_data=Page(view=view, backward=False, cursor=next_cursor).pack()))
+    if not buttons:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
+
+def search_keyboard(offset: int, has_more: bool):
+    buttons = []
+    if offset:
+        buttons.append(InlineKeyboardButton(text="◀️ Назад", callback_data=SearchPage(offset=max(offset - PAGE_SIZE, 0)).pack()))
+    if has_more:
+        buttons.append(InlineKeyboardButton(text="Вперед ▶️", callback_data=SearchPage(offset=offset + PAGE_SIZE).pack()))
+    if not buttons:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
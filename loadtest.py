@@ -0,0 +1,621 @@
+#loadtest.py
+# Replays synthetic update streams through bot.dp against a local mock Bot API
+# and a temporary SQLite database:
+#   python loadtest.py --users 200
+#   python loadtest.py --roster 10000
+#   python loadtest.py --fsm 1000 [--redis-url redis://localhost:6379/0]
+#   python loadtest.py --keyboards 10000
+#   python loadtest.py --callbacks 5000
+#   python loadtest.py --assign 5000 [--assign-appointments 50000]
+#   python loadtest.py --search 1000000
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from aiohttp import web
+from aiogram.types import Update
+from sqlalchemy import event
+import config
+from callbacks import Confirm, PickSpecialist
+
+MOCK_HOST = '127.0.0.1'
+
+# Statement counter of the update being processed in the current task
+current_queries = ContextVar('current_queries', default=None)
+
+
+# Local stand-in for api.telegram.org
+class MockTelegramAPI:
+    def __init__(self, port: int = 0):
+        self.port = port
+        self.calls = 0
+        self.message_id = 0
+        self.runner = None
+
+    def _message(self, chat_id, text=None):
+        self.message_id += 1
+        return {
+            'message_id': self.message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id or 0), 'type': 'private'},
+            'text': text or '',
+        }
+
+    async def handle(self, request: web.Request):
+        self.calls += 1
+        method = request.match_info['method'].lower()
+        params = await request.post()
+        if method == 'getme':
+            result = {'id': 42, 'is_bot': True, 'first_name': 'loadtest', 'username': 'loadtest_bot'}
+        elif method.startswith('send') or method.startswith('edit'):
+            result = self._message(params.get('chat_id'), params.get('text'))
+        elif method == 'getupdates':
+            result = []
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, MOCK_HOST, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return f'http://{MOCK_HOST}:{self.port}'
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+def message_update(update_id: int, user_id: int, text: str):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'},
+            'text': text,
+        },
+    }
+
+
+def callback_update(update_id: int, user_id: int, data: str):
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'},
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'text': '',
+            },
+        },
+    }
+
+
+def percentile(values, q: float):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q * len(values)) - 1))
+    return values[index]
+
+
+class LoadTest:
+    def __init__(self, app, bot, engine):
+        self.app = app
+        self.bot = bot
+        self.update_id = 0
+        self.results = {}
+        event.listen(engine.sync_engine, 'before_cursor_execute', self._count_query)
+
+    def _count_query(self, *args):
+        counter = current_queries.get()
+        if counter is not None:
+            counter[0] += 1
+
+    def next_id(self):
+        self.update_id += 1
+        return self.update_id
+
+    async def feed(self, flow: str, payload: dict):
+        update = Update.model_validate(payload, context={'bot': self.bot})
+        counter = [0]
+        token = current_queries.set(counter)
+        started = time.perf_counter()
+        try:
+            await self.app.dp.feed_update(self.bot, update)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_queries.reset(token)
+        stats = self.results.setdefault(flow, {'latency': [], 'queries': 0, 'wall': 0.0})
+        stats['latency'].append(elapsed)
+        stats['queries'] += counter[0]
+
+    async def run_flow(self, flow: str, scripts, concurrency: int):
+        # Each script is one user's ordered update list; users run in parallel
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_script(script):
+            async with semaphore:
+                for payload in script:
+                    await self.feed(flow, payload)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run_script(script) for script in scripts))
+        self.results[flow]['wall'] = time.perf_counter() - started
+
+    def report(self):
+        lines = [f"{'flow':<14}{'updates':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'upd/s':>9}{'q/upd':>8}"]
+        for flow, stats in self.results.items():
+            latency = stats['latency']
+            count = len(latency)
+            lines.append(
+                f"{flow:<14}{count:>9}"
+                f"{percentile(latency, 0.50) * 1000:>9.2f}"
+                f"{percentile(latency, 0.95) * 1000:>9.2f}"
+                f"{percentile(latency, 0.99) * 1000:>9.2f}"
+                f"{count / stats['wall'] if stats['wall'] else 0:>9.0f}"
+                f"{stats['queries'] / count if count else 0:>8.1f}"
+            )
+        return '\n'.join(lines)
+
+
+# Broadcast to `count` extra clients; tracemalloc peak shows recipients are never all in memory
+async def broadcast_benchmark(app, database, api, count: int):
+    import tracemalloc
+    from sqlalchemy import insert
+    async with database.AsyncSessionMaker() as session:
+        first = 10 ** 9
+        for offset in range(0, count, 10000):
+            await session.execute(insert(database.Client), [
+                {'telegram_id': first + i, 'name': f'bulk{i}', 'city': 'Казань'}
+                for i in range(offset, min(offset + 10000, count))
+            ])
+        await session.commit()
+        item = await app.broadcast.create(session, 'Отзывная кампания', app.broadcast.parse_filters(['city=Казань']))
+        await session.commit()
+    calls = api.calls
+    tracemalloc.start()
+    started = time.perf_counter()
+    await app.broadcast.run(item.id)
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    async with database.AsyncSessionMaker() as session:
+        item = await session.get(database.Broadcast, item.id)
+    print(f'broadcast: {item.sent} sent, {item.failed} failed, {api.calls - calls} API calls, '
+          f'{wall:.1f} s, {item.sent / wall:.0f} msg/s, peak traced memory {peak / 2 ** 20:.1f} MB')
+
+
+# Sharded mode throughput: the same '📋 Мои заявки' traffic through 1..N worker processes
+async def shard_benchmark(args):
+    from sqlalchemy import insert
+    from sharding import Supervisor
+    tmp = tempfile.mkdtemp(prefix='loadtest-shards-')
+    api = MockTelegramAPI(args.port)
+    base = await api.start()
+    overrides = {
+        'DB_URL': f"sqlite+aiosqlite:///{os.path.join(tmp, 'loadtest.db')}",
+        'FSM_STORAGE': 'memory',
+        'OUTBOX_GLOBAL_RATE': 1e6,
+        'OUTBOX_CHAT_RATE': 1e6,
+        'METRICS_PORT': None,
+        'JOBSTORE_URL': f"sqlite:///{os.path.join(tmp, 'jobs.db')}",
+        'API_SERVER': base,
+        'MODE': 'sharded',
+    }
+    for key, value in overrides.items():
+        setattr(config, key, value)
+    import database
+    from migrations import migrate
+    await migrate()
+    users = [100000 + i for i in range(args.users)]
+    async with database.AsyncSessionMaker() as session:
+        await session.execute(insert(database.Client), [
+            {'id': i + 1, 'telegram_id': user, 'name': f'user{user}', 'city': 'Москва'} for i, user in enumerate(users)
+        ])
+        await session.execute(insert(database.Appointment), [
+            {'client_id': i + 1, 'description': f'Заявка {n} клиента {user}', 'created_at': datetime.now()}
+            for i, user in enumerate(users) for n in range(10)
+        ])
+        await session.commit()
+    await database.engine.dispose()
+
+    counter = 0
+    print(f"{'shards':<8}{'updates':>9}{'seconds':>9}{'upd/s':>9}")
+    for shards in [int(n) for n in args.shards.split(',')]:
+        supervisor = Supervisor(shards, overrides)
+        await supervisor.start()
+        updates = []
+        for _ in range(args.shard_updates // len(users) + 1):
+            for user in users:
+                counter += 1
+                updates.append(message_update(counter, user, '📋 Мои заявки'))
+        updates = updates[:args.shard_updates]
+        calls = api.calls
+        started = time.perf_counter()
+        for data in updates:
+            await supervisor.dispatch(data)
+        while api.calls - calls < len(updates):
+            await asyncio.sleep(0.01)
+        wall = time.perf_counter() - started
+        await supervisor.stop()
+        print(f"{shards:<8}{len(updates):>9}{wall:>9.2f}{len(updates) / wall:>9.0f}")
+    await api.stop()
+
+
+# FSM storage latency per backend, with process_registration's get_data/update_data pattern
+async def fsm_benchmark(args):
+    from aiogram.fsm.context import FSMContext
+    from aiogram.fsm.storage.base import StorageKey
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from storage import SQLiteStorage
+    tmp = tempfile.mkdtemp(prefix='loadtest-fsm-')
+    backends = [
+        ('memory', MemoryStorage()),
+        ('sqlite', SQLiteStorage(os.path.join(tmp, 'fsm.db'), config.FSM_FLUSH_INTERVAL, config.FSM_CACHE_TTL)),
+    ]
+    if args.redis_url:
+        from aiogram.fsm.storage.redis import RedisStorage
+        backends.append(('redis', RedisStorage.from_url(args.redis_url)))
+    print(f"{'backend':<9}{'operation':<13}{'p50 us':>9}{'p95 us':>9}{'p99 us':>9}")
+    for name, storage in backends:
+        timings = {'get_data': [], 'update_data': []}
+        for user in range(args.fsm):
+            state = FSMContext(storage, StorageKey(bot_id=42, chat_id=user, user_id=user))
+            # One registration: each step reads the data, then stores the answer and the step counter
+            for step, field in enumerate(('name', 'city', 'workplace', 'product_type', 'serial_number')):
+                started = time.perf_counter()
+                await state.get_data()
+                timings['get_data'].append(time.perf_counter() - started)
+                for value in ({field: f'{field} {user}'}, {'reg_step': step + 1}):
+                    started = time.perf_counter()
+                    await state.update_data(value)
+                    timings['update_data'].append(time.perf_counter() - started)
+            await state.clear()
+        await storage.close()
+        for operation, values in timings.items():
+            print(f'{name:<9}{operation:<13}' + ''.join(
+                f'{percentile(values, q) * 1e6:>9.0f}' for q in (0.50, 0.95, 0.99)
+            ))
+
+
+# Keyboard build + serialize per call: fresh markups on every call, as before keyboards.py
+# cached them, against the keyboards.py factories sent through KeyboardSession
+async def keyboard_benchmark(args):
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+    import keyboards
+    plain, cached = AiohttpSession(), keyboards.KeyboardSession()
+    bot = Bot(token='42:LOADTEST', session=cached)
+
+    def inline(*buttons):
+        return InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text=text, callback_data=data) for text, data in buttons]])
+
+    cases = [
+        ('client main', lambda i: keyboards._reply([['📝 Новая заявка'], ['📋 Мои заявки']]),
+         lambda i: keyboards.client_main_keyboard()),
+        ('admin main', lambda i: keyboards._reply([['📊 Статистика', '📅 Записи'], ['🔨 ЧС', '👥 Специалисты']]),
+         lambda i: keyboards.admin_main_keyboard()),
+        ('specialist main', lambda i: keyboards._reply([['✅ Готов к работе'], ['📅 Расписание', '📊 Отчеты']]),
+         lambda i: keyboards.specialist_main_keyboard(True)),
+        ('confirmation', lambda i: inline(('✅ Подтвердить', f'confirm_{i}'), ('❌ Отменить', f'cancel_{i}')),
+         keyboards.confirmation_keyboard),
+        ('rating', lambda i: inline(*((str(n), f'rate_{n}_{i}') for n in range(1, 6))),
+         keyboards.rating_keyboard),
+    ]
+
+    def per_call(build, session):
+        started = time.perf_counter()
+        for i in range(args.keyboards):
+            session.prepare_value(build(i), bot, {})
+        return (time.perf_counter() - started) / args.keyboards * 1e6
+
+    print(f"{'keyboard':<17}{'before us':>10}{'after us':>10}")
+    for name, before, after in cases:
+        print(f'{name:<17}{per_call(before, plain):>10.1f}{per_call(after, cached):>10.1f}')
+    await plain.close()
+    await cached.close()
+
+
+# Routing cost per callback through Dispatcher.feed_update with four no-op handlers:
+# prefix string filters, as before callbacks.py, against one decode plus callbacks.Is
+async def callback_benchmark(args):
+    from aiogram import Bot, Dispatcher, F
+    from callbacks import Is, Cancel, Rate
+    from middlewares import CallbackDataMiddleware
+    bot = Bot(token='42:LOADTEST')
+
+    async def noop(callback):
+        pass
+
+    before = Dispatcher()
+    for name in ('confirm_', 'cancel_', 'spec_', 'rate_'):
+        before.callback_query.register(noop, F.data.startswith(name))
+    after = Dispatcher()
+    after.callback_query.outer_middleware(CallbackDataMiddleware())
+    for cls in (Confirm, Cancel, PickSpecialist, Rate):
+        after.callback_query.register(noop, Is(cls))
+
+    async def per_call(dp, data):
+        update = Update.model_validate(callback_update(1, 1, data), context={'bot': bot})
+        started = time.perf_counter()
+        for _ in range(args.callbacks):
+            await dp.feed_update(bot, update)
+        return (time.perf_counter() - started) / args.callbacks * 1e6
+
+    logging.getLogger('aiogram.event').setLevel(logging.WARNING)
+    print(f"{'handler':<9}{'before us':>10}{'after us':>10}")
+    for name, old, new in (('first', 'confirm_123456', Confirm(appointment_id=123456).pack()),
+                           ('last', 'rate_5_123456', Rate(score=5, appointment_id=123456).pack())):
+        print(f'{name:<9}{await per_call(before, old):>10.0f}{await per_call(after, new):>10.0f}')
+    await bot.session.close()
+
+
+# Startup roster sync: one bulk upsert, against the per-specialist SELECT loop it replaced
+async def roster_benchmark(args):
+    from sqlalchemy import select
+    tmp = tempfile.mkdtemp(prefix='loadtest-roster-')
+    config.DB_URL = f"sqlite+aiosqlite:///{os.path.join(tmp, 'loadtest.db')}"
+    import database
+    from migrations import migrate
+    from roster import sync_specialists
+    await migrate()
+    roster = [
+        {'telegram_id': 10 ** 6 + i, 'name': f'Специалист {i}', 'username': f'@spec{i}', 'city': 'Москва'}
+        for i in range(args.roster)
+    ]
+
+    async def timed(label: str, rows):
+        async with database.AsyncSessionMaker() as session:
+            started = time.perf_counter()
+            synced, deactivated = await sync_specialists(session, rows)
+            await session.commit()
+        print(f'{label:<26}{time.perf_counter() - started:>7.2f} s  synced {synced}, deactivated {deactivated}')
+
+    await timed('initial sync', roster)
+    await timed('re-sync, 10% removed', roster[args.roster // 10:])
+    await timed('re-sync, all back', roster)
+    async with database.AsyncSessionMaker() as session:
+        started = time.perf_counter()
+        for row in roster:
+            await session.scalar(select(database.Specialist.id).where(database.Specialist.telegram_id == row['telegram_id']))
+    print(f"{'per-row SELECT loop':<26}{time.perf_counter() - started:>7.2f} s  lookups only")
+
+
+# Per-decision cost of AssignmentEngine.rank (picker, top 100) and best (auto-assign) over a
+# roster and its approved appointments loaded from the database, against sorting every free specialist
+async def assign_benchmark(args):
+    import random
+    from sqlalchemy import insert
+    tmp = tempfile.mkdtemp(prefix='loadtest-assign-')
+    config.DB_URL = f"sqlite+aiosqlite:///{os.path.join(tmp, 'loadtest.db')}"
+    import database
+    from migrations import migrate
+    from roster import sync_specialists
+    from assignment import assigner
+    await migrate()
+    rng = random.Random(14)
+    cities = [f'Город {i}' for i in range(20)]
+    start = datetime.now(config.TIMEZONE).replace(tzinfo=None, minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    appointments = args.assign_appointments or args.assign * 10
+    async with database.AsyncSessionMaker() as session:
+        await sync_specialists(session, [
+            {'telegram_id': 10 ** 6 + i, 'name': f'Специалист {i}', 'username': f'@spec{i}', 'city': rng.choice(cities)}
+            for i in range(args.assign)
+        ])
+        client_id = (await session.execute(insert(database.Client).values(telegram_id=1, name='Клиент'))).inserted_primary_key[0]
+        await session.execute(insert(database.Appointment), [
+            {'client_id': client_id, 'specialist_id': rng.randint(1, args.assign), 'status': database.StatusEnum.approved,
+             'date': start + timedelta(minutes=30 * rng.randint(0, 14 * 48)), 'description': 'нагрузка'}
+            for _ in range(appointments)
+        ])
+        await session.commit()
+        await assigner.load(session)
+    decisions = [(start + timedelta(minutes=30 * rng.randint(0, 14 * 48)), rng.choice(cities)) for _ in range(1000)]
+
+    def full_sort(date, city):
+        city = city.lower()
+        candidates = [c for c in (assigner._candidate(assigner.index, spec_id, date, city) for spec_id in assigner.specialists) if c]
+        return sorted(candidates, key=lambda c: (not c.local, c.load, c.specialist_id))[:100]
+
+    def per_decision(decide):
+        latency = []
+        for date, city in decisions:
+            started = time.perf_counter()
+            decide(date, city)
+            latency.append(time.perf_counter() - started)
+        return latency
+
+    print(f'{args.assign} specialists, {appointments} approved appointments over 14 days')
+    print(f"{'decision':<22}{'p50 ms':>9}{'p99 ms':>9}")
+    for name, decide in (('sort all (before)', full_sort),
+                         ('rank top 100', lambda date, city: assigner.rank(date, city, limit=100)),
+                         ('best', assigner.best)):
+        latency = per_decision(decide)
+        print(f'{name:<22}{percentile(latency, 0.50) * 1000:>9.3f}{percentile(latency, 0.99) * 1000:>9.3f}')
+    await database.engine.dispose()
+
+
+# Admin search latency: N clients and N appointments inserted through the FTS triggers,
+# then search.search() timed for serial, phone, name, city and description queries
+async def search_benchmark(args):
+    import random
+    from sqlalchemy import insert
+    tmp = tempfile.mkdtemp(prefix='loadtest-search-')
+    config.DB_URL = f"sqlite+aiosqlite:///{os.path.join(tmp, 'loadtest.db')}"
+    import database
+    import search
+    from migrations import migrate
+    await migrate()
+    rng = random.Random(21)
+    surnames = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов', 'Михайлов', 'Новиков']
+    names = ['Иван', 'Пётр', 'Алексей', 'Сергей', 'Андрей', 'Дмитрий', 'Олег', 'Михаил']
+    cities = [f'Город {i}' for i in range(5)] + ['Москва', 'Казань', 'Омск', 'Тверь', 'Самара']
+    products = ['Станок', 'Насос', 'Компрессор', 'Пресс', 'Генератор']
+    words = ['не', 'включается', 'шумит', 'течёт', 'перегрев', 'вибрация', 'ошибка', 'датчик', 'двигатель', 'подшипник',
+             'насос', 'давление', 'масло', 'ремень', 'плата', 'дисплей', 'замена', 'настройка', 'гарантия', 'срочно']
+    batch = 10000
+    started = time.perf_counter()
+    async with database.AsyncSessionMaker() as session:
+        for lo in range(0, args.search, batch):
+            await session.execute(insert(database.Client), [
+                {'telegram_id': 10 ** 7 + i, 'name': f'{rng.choice(surnames)}{i % 1000} {rng.choice(names)}',
+                 'city': rng.choice(cities), 'workplace': 'Завод', 'product_type': rng.choice(products),
+                 'serial_number': f'SN-{i:07d}', 'phone': f'+7900{i:07d}'}
+                for i in range(lo, min(lo + batch, args.search))
+            ])
+            await session.execute(insert(database.Appointment), [
+                {'client_id': i + 1, 'description': ' '.join(rng.choices(words, k=8)) + f' заказ {i}'}
+                for i in range(lo, min(lo + batch, args.search))
+            ])
+            await session.commit()
+    elapsed = time.perf_counter() - started
+    print(f'{args.search} clients + {args.search} appointments inserted in {elapsed:.1f} s '
+          f'({2 * args.search / elapsed:.0f} rows/s)')
+    target = args.search // 2
+    queries = [
+        ('serial', f'SN-{target:07d}'),
+        ('serial fragment', f'{target:07d}'[-5:]),
+        ('phone', f'+7900{target:07d}'),
+        ('phone fragment', f'{target:07d}'[-6:]),
+        ('name + number', f'Петров{target % 1000}'),
+        ('whole city', 'Москва'),
+        ('description word', 'подшипник'),
+        ('description prefix', 'перегр'),
+        ('order number', f'заказ {target}'),
+    ]
+    print(f"{'query':<20}{'p50 ms':>9}{'p99 ms':>9}{'page':>6}")
+    async with database.AsyncSessionMaker() as session:
+        for name, query in queries:
+            latency = []
+            for _ in range(args.search_repeats):
+                started = time.perf_counter()
+                clients, apps, _ = await search.search(session, query)
+                latency.append(time.perf_counter() - started)
+            print(f'{name:<20}{percentile(latency, 0.50) * 1000:>9.1f}{percentile(latency, 0.99) * 1000:>9.1f}'
+                  f'{len(clients) + len(apps):>6}')
+    await database.engine.dispose()
+
+
+async def main(args):
+    tmp = tempfile.mkdtemp(prefix='loadtest-')
+    # Patch config before the bot modules read it
+    config.DB_URL = f"sqlite+aiosqlite:///{os.path.join(tmp, 'loadtest.db')}"
+    config.FSM_STORAGE = 'memory'
+    config.OUTBOX_GLOBAL_RATE = 1e6
+    config.OUTBOX_CHAT_RATE = 1e6
+    config.METRICS_PORT = None
+    config.JOBSTORE_URL = f"sqlite:///{os.path.join(tmp, 'jobs.db')}"
+
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from sqlalchemy import select
+    import database
+    import bot as app
+    logging.getLogger().setLevel(logging.WARNING)
+
+    api = MockTelegramAPI(args.port)
+    base = await api.start()
+    bot = Bot(token='42:LOADTEST', session=AiohttpSession(api=TelegramAPIServer.from_base(base)))
+    await app.on_startup(bot)
+    test = LoadTest(app, bot, database.engine)
+
+    users = [100000 + i for i in range(args.users)]
+    steps = [
+        '/start', config.CODEWORD, 'Иван Иванов', 'Москва', 'Завод', 'Станок', 'SN-0001', '+70000000000'
+    ]
+    await test.run_flow('registration', [
+        [message_update(test.next_id(), user, text) for text in steps] for user in users
+    ], args.concurrency)
+    await test.run_flow('new_request', [
+        [
+            message_update(test.next_id(), user, '📝 Новая заявка'),
+            message_update(test.next_id(), user, f'Не работает станок у {user}'),
+        ]
+        for user in users
+    ], args.concurrency)
+
+    async with database.AsyncSessionMaker() as session:
+        appointment_ids = (await session.scalars(
+            select(database.Appointment.id).where(database.Appointment.status == database.StatusEnum.pending)
+        )).all()
+        specialists = (await session.execute(
+            select(database.Specialist.id, database.Specialist.telegram_id)
+        )).all()
+
+    # The admin has a single FSM context, so confirmations run one after another
+    if specialists:
+        start = datetime.now(config.TIMEZONE).replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        script = []
+        for i, appointment_id in enumerate(appointment_ids):
+            spec_id, _ = specialists[i % len(specialists)]
+            date = start + timedelta(hours=i // len(specialists))
+            script += [
+                callback_update(test.next_id(), config.ADMIN_ID, Confirm(appointment_id=appointment_id).pack()),
+                message_update(test.next_id(), config.ADMIN_ID, date.strftime('%d.%m.%Y %H:%M')),
+                callback_update(test.next_id(), config.ADMIN_ID, PickSpecialist(specialist_id=spec_id).pack()),
+            ]
+        await test.run_flow('admin_confirm', [script], 1)
+        await test.run_flow('schedule', [
+            [message_update(test.next_id(), tg_id, '📅 Расписание') for _ in range(args.schedule_views)]
+            for _, tg_id in specialists
+        ], args.concurrency)
+
+    if args.broadcast:
+        await broadcast_benchmark(app, database, api, args.broadcast)
+
+    await app.on_shutdown()
+    await bot.session.close()
+    await api.stop()
+    print(test.report())
+    print(f'Bot API calls: {api.calls}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Dispatcher load test')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--schedule-views', type=int, default=20)
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--broadcast', type=int, default=0, help='recipients for the broadcast benchmark')
+    parser.add_argument('--shards', default='', help='comma-separated worker counts for the sharded benchmark, e.g. 1,2,4')
+    parser.add_argument('--shard-updates', type=int, default=5000)
+    parser.add_argument('--roster', type=int, default=0, help='specialists for the roster sync benchmark, e.g. 10000')
+    parser.add_argument('--fsm', type=int, default=0, help='registrations for the FSM storage benchmark')
+    parser.add_argument('--redis-url', default='', help='also benchmark RedisStorage against this server')
+    parser.add_argument('--keyboards', type=int, default=0, help='calls per keyboard for the keyboard benchmark')
+    parser.add_argument('--callbacks', type=int, default=0, help='callbacks per case for the routing benchmark')
+    parser.add_argument('--assign', type=int, default=0, help='specialists for the assignment benchmark, e.g. 5000')
+    parser.add_argument('--assign-appointments', type=int, default=0, help='approved appointments, default 10 per specialist')
+    parser.add_argument('--search', type=int, default=0, help='clients and appointments for the search benchmark, e.g. 1000000')
+    parser.add_argument('--search-repeats', type=int, default=20)
+    args = parser.parse_args()
+    if args.search:
+        asyncio.run(search_benchmark(args))
+    elif args.assign:
+        asyncio.run(assign_benchmark(args))
+    elif args.callbacks:
+        asyncio.run(callback_benchmark(args))
+    elif args.keyboards:
+        asyncio.run(keyboard_benchmark(args))
+    elif args.fsm:
+        asyncio.run(fsm_benchmark(args))
+    elif args.roster:
+        asyncio.run(roster_benchmark(args))
+    else:
+        asyncio.run(shard_benchmark(args) if args.shards else main(args))
@@ -0,0 +1,213 @@
+#metrics.py
+import time
+from contextlib import contextmanager
+from bisect import bisect_left
+from contextvars import ContextVar
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from sqlalchemy import event
+from database import engine
+from outbox import outbox
+from cache import role_cache
+from jobs import job_stats
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Startup phases of this process, in seconds
+startup_phases = {}
+
+
+@contextmanager
+def startup_phase(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_phases[name] = time.perf_counter() - started
+
+
+# Timings of the update being processed in the current task
+_current = ContextVar('metrics_update', default=None)
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            le = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{le} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.series = {}
+
+    def inc(self, labels: tuple, value: float = 1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in self.series.items():
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+HANDLER_SECONDS = Histogram('bot_handler_seconds', 'Update processing wall time', ('handler', 'state'))
+HANDLER_SQL_SECONDS = Histogram('bot_handler_sql_seconds', 'Time spent in SQL per update', ('handler', 'state'))
+HANDLER_API_SECONDS = Histogram('bot_handler_api_seconds', 'Time spent in Bot API calls per update', ('handler', 'state'))
+SQL_STATEMENTS = Counter('bot_sql_statements_total', 'SQL statements executed', ('handler', 'state'))
+API_SECONDS = Histogram('bot_api_request_seconds', 'Bot API request latency', ('method',))
+METRICS = [HANDLER_SECONDS, HANDLER_SQL_SECONDS, HANDLER_API_SECONDS, SQL_STATEMENTS, API_SECONDS]
+
+
+# SQL timing via engine events
+@event.listens_for(engine.sync_engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(engine.sync_engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    current = _current.get()
+    if current is not None:
+        current['sql_time'] += elapsed
+        current['sql_count'] += 1
+
+
+# Outer update middleware: owns the per-update timings
+class MetricsMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        current = {'handler': 'unhandled', 'state': '-', 'sql_time': 0.0, 'sql_count': 0, 'api_time': 0.0}
+        token = _current.set(current)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            labels = (current['handler'], current['state'])
+            HANDLER_SECONDS.observe(labels, elapsed)
+            HANDLER_SQL_SECONDS.observe(labels, current['sql_time'])
+            HANDLER_API_SECONDS.observe(labels, current['api_time'])
+            SQL_STATEMENTS.inc(labels, current['sql_count'])
+
+
+# Inner middleware: labels the update with the handler that matched it
+class HandlerLabelMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        current = _current.get()
+        if current is not None:
+            current['handler'] = data['handler'].callback.__name__
+            current['state'] = data.get('raw_state') or '-'
+        return await handler(event, data)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            elapsed = time.perf_counter() - started
+            API_SECONDS.observe((type(method).__name__,), elapsed)
+            current = _current.get()
+            if current is not None:
+                current['api_time'] += elapsed
+
+
+def setup(dp):
+    dp.update.outer_middleware(MetricsMiddleware())
+    label = HandlerLabelMiddleware()
+    dp.message.middleware(label)
+    dp.callback_query.middleware(label)
+
+
+def instrument_bot(bot):
+    if not getattr(bot.session, '_metrics_installed', False):
+        bot.session.middleware(ApiMetricsMiddleware())
+        bot.session._metrics_installed = True
+
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    lines.append('# TYPE bot_outbox_depth gauge')
+    lines.append(f'bot_outbox_depth {outbox.queue.qsize()}')
+    outbox_stats = outbox.stats()
+    for key in ('sent', 'failed', 'retried'):
+        lines.append(f'# TYPE bot_outbox_{key}_total counter')
+        lines.append(f'bot_outbox_{key}_total {outbox_stats[key]}')
+    lines.append('# TYPE bot_outbox_latency_seconds_avg gauge')
+    lines.append(f'bot_outbox_latency_seconds_avg {outbox_stats["latency_avg"]}')
+    cache_stats = role_cache.stats()
+    lines.append('# TYPE bot_role_cache_hits_total counter')
+    lines.append(f'bot_role_cache_hits_total {cache_stats["hits"]}')
+    lines.append('# TYPE bot_role_cache_misses_total counter')
+    lines.append(f'bot_role_cache_misses_total {cache_stats["misses"]}')
+    lines.append('# TYPE bot_job_last_seconds gauge')
+    for name, entry in job_stats.items():
+        lines.append(f'bot_job_last_seconds{{job="{name}"}} {entry["last"]}')
+    lines.append('# TYPE bot_job_runs_total counter')
+    for name, entry in job_stats.items():
+        lines.append(f'bot_job_runs_total{{job="{name}"}} {entry["runs"]}')
+    lines.append('# TYPE bot_startup_phase_seconds gauge')
+    for name, seconds in startup_phases.items():
+        lines.append(f'bot_startup_phase_seconds{{phase="{name}"}} {seconds}')
+    return '\n'.join(lines) + '\n'
+
+
+async def handle_metrics(request: web.Request):
+    return web.Response(text=render(), content_type='text/plain', charset='utf-8')
+
+
+_runner = None
+
+
+async def start_server(host: str, port: int):
+    global _runner
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    _runner = web.AppRunner(app)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+
+
+async def stop_server():
+    if _runner is not None:
+        await _runner.cleanup()
@@ -0,0 +1,20 @@
+#middlewares.py
+from aiogram import BaseMiddleware
+from database import AsyncSessionMaker
+from callbacks import decode
+
+
+# One session per update, passed to handlers as `session`.
+# A connection is only checked out once the handler runs its first query.
+class DbSessionMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        async with AsyncSessionMaker() as session:
+            data['session'] = session
+            return await handler(event, data)
+
+
+# Decodes callback data once by its exact prefix; handlers then match on the type with callbacks.Is
+class CallbackDataMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        data['callback_data'] = decode(event.data)
+        return await handler(event, data)
@@ -0,0 +1,59 @@
+#migrations.py
+import logging
+from sqlalchemy import select, insert, update, func, inspect
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from database import engine, Base, SchemaVersion, Appointment, Specialist, create_indexes
+import search
+
+# Boot only reads the stored version; steps run once, in order, and must be idempotent
+# so that databases created before versioning (version 0) can replay them safely.
+
+# Columns added after their tables first shipped; create_all leaves existing tables alone
+ADDED_COLUMNS = [
+    Appointment.__table__.c.reminded_at,
+    Specialist.__table__.c.is_active,
+    Specialist.__table__.c.city,
+]
+
+
+def _tables_columns_indexes(sync_conn):
+    Base.metadata.create_all(sync_conn)
+    inspector = inspect(sync_conn)
+    for column in ADDED_COLUMNS:
+        existing = {col['name'] for col in inspector.get_columns(column.table.name)}
+        if column.name not in existing:
+            logging.info(f"Миграция: добавляем {column.table.name}.{column.name}")
+            sync_conn.exec_driver_sql(
+                f"ALTER TABLE {column.table.name} ADD COLUMN {column.name} {column.type.compile(sync_conn.dialect)}"
+            )
+    sync_conn.execute(update(Specialist).where(Specialist.is_active.is_(None)).values(is_active=True))
+    create_indexes(sync_conn)
+
+
+MIGRATIONS = [
+    (1, 'tables, added columns and indexes', _tables_columns_indexes),
+    (2, 'full-text search', search.create_schema),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+async def current_version():
+    try:
+        async with engine.connect() as conn:
+            return await conn.scalar(select(func.max(SchemaVersion.version))) or 0
+    except (OperationalError, ProgrammingError):
+        # No schema_version table yet
+        return 0
+
+
+async def migrate():
+    version = await current_version()
+    if version >= SCHEMA_VERSION:
+        return version
+    async with engine.begin() as conn:
+        for number, name, step in MIGRATIONS:
+            if number > version:
+                logging.info(f"Миграция {number}: {name}")
+                await conn.run_sync(step)
+                await conn.execute(insert(SchemaVersion).values(version=number))
+    return SCHEMA_VERSION
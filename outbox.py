@@ -0,0 +1,153 @@
+#outbox.py
+import asyncio
+import logging
+import time
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError
+from aiogram.methods import SendMessage
+import config
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        # Takes a token, booking a future one if none is left; returns the wait until it is due
+        self._refill()
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def is_full(self):
+        self._refill()
+        return self.tokens >= self.capacity
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# Outbound delivery queue: handlers enqueue, workers send within Telegram limits
+# Limits are read from config in start(), so per-process overrides (sharding.worker_main) apply
+class Outbox:
+    def __init__(self):
+        self.chat_rate = None
+        self.max_retries = None
+        self.global_bucket = None
+        self.chat_buckets = {}
+        self.queue = asyncio.Queue()
+        self.bot = None
+        self._tasks = []
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    def send(self, method):
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((method, time.monotonic(), future, False))
+        return future
+
+    def send_message(self, chat_id: int, text: str, **kwargs):
+        return self.send(SendMessage(chat_id=chat_id, text=text, **kwargs))
+
+    async def start(self, bot):
+        self.bot = bot
+        if not self._tasks:
+            self.chat_rate = config.OUTBOX_CHAT_RATE
+            self.max_retries = config.OUTBOX_MAX_RETRIES
+            self.global_bucket = TokenBucket(config.OUTBOX_GLOBAL_RATE)
+            self.chat_buckets = {}
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(config.OUTBOX_WORKERS)]
+
+    async def stop(self, timeout: float = 10):
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Outbox: {self.queue.qsize()} messages not delivered on shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                self.chat_buckets = {k: b for k, b in self.chat_buckets.items() if not b.is_full()}
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate)
+        return bucket
+
+    def _requeue(self, method, enqueued, future):
+        # Put back before marking done, so queue.join() in stop() keeps waiting for it
+        self.queue.put_nowait((method, enqueued, future, True))
+        self.queue.task_done()
+
+    async def _deliver(self, method):
+        for attempt in range(self.max_retries + 1):
+            await self.global_bucket.acquire()
+            try:
+                return await self.bot(method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retried += 1
+                await asyncio.sleep(e.retry_after)
+            except TelegramNetworkError:
+                if attempt == self.max_retries:
+                    raise
+                self.retried += 1
+                await asyncio.sleep(2 ** attempt)
+
+    async def _worker(self):
+        while True:
+            method, enqueued, future, reserved = await self.queue.get()
+            if not reserved:
+                delay = self._chat_bucket(getattr(method, 'chat_id', None)).reserve()
+                if delay:
+                    # The chat is over its rate: come back when its token is due and keep
+                    # this worker for other chats meanwhile
+                    asyncio.get_running_loop().call_later(delay, self._requeue, method, enqueued, future)
+                    continue
+            result = None
+            try:
+                result = await self._deliver(method)
+                self.sent += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"Outbox: не удалось отправить {type(method).__name__}: {e}")
+            finally:
+                latency = time.monotonic() - enqueued
+                self.latency_sum += latency
+                self.latency_max = max(self.latency_max, latency)
+                if not future.done():
+                    future.set_result(result)
+                self.queue.task_done()
+
+    def stats(self):
+        delivered = self.sent + self.failed
+        return {
+            'depth': self.queue.qsize(),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'latency_avg': self.latency_sum / delivered if delivered else 0.0,
+            'latency_max': self.latency_max,
+        }
+
+
+outbox = Outbox()
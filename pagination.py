@@ -0,0 +1,65 @@
+#pagination.py
+from datetime import datetime
+from sqlalchemy import DateTime, tuple_
+from config import PAGE_SIZE
+
+DT_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+# Keyset pagination over (sort column, ..., id)
+class Keyset:
+    def __init__(self, *columns, descending: bool = False):
+        self.columns = columns
+        self.descending = descending
+
+    def encode(self, row):
+        values = []
+        for col in self.columns:
+            value = getattr(row, col.key)
+            values.append(value.strftime(DT_FORMAT) if isinstance(value, datetime) else str(value))
+        return '.'.join(values)
+
+    # Cursors come back in client callback data: a malformed one decodes to None
+    def decode(self, raw: str):
+        parts = raw.split('.')
+        if len(parts) != len(self.columns):
+            return None
+        values = []
+        try:
+            for col, value in zip(self.columns, parts):
+                if isinstance(col.type, DateTime):
+                    values.append(datetime.strptime(value, DT_FORMAT))
+                else:
+                    values.append(int(value))
+        except ValueError:
+            return None
+        return values
+
+    def apply(self, stmt, cursor, backward: bool, limit: int):
+        # Walking backwards flips both the comparison and the order
+        reverse = self.descending != backward
+        key = tuple_(*self.columns)
+        if cursor:
+            values = tuple_(*self.decode(cursor))
+            stmt = stmt.where(key < values if reverse else key > values)
+        order = [col.desc() if reverse else col.asc() for col in self.columns]
+        return stmt.order_by(*order).limit(limit + 1)
+
+
+async def fetch_page(session, stmt, keyset: Keyset, cursor: str = None, backward: bool = False,
+                     limit: int = PAGE_SIZE):
+    if cursor and keyset.decode(cursor) is None:
+        # Unreadable cursor: serve the first page
+        cursor, backward = None, False
+    res = await session.execute(keyset.apply(stmt, cursor, backward, limit))
+    rows = res.scalars().all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = cursor is not None, more
+    prev_cursor = keyset.encode(rows[0]) if rows and has_prev else None
+    next_cursor = keyset.encode(rows[-1]) if rows and has_next else None
+    return rows, prev_cursor, next_cursor
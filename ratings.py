@@ -0,0 +1,99 @@
+#ratings.py
+from sqlalchemy import select, update, func
+from config import RATING_CHUNK
+from database import Appointment, Client, Rating, StatCounter, StatusEnum
+from cache import rating_cache, MISSING
+import stats
+
+
+# Specialist closes an approved appointment by rating the client.
+# Returns the new Rating and the appointment's previous (status, specialist_id, date) row,
+# or (None, None) if the appointment is not theirs or was already closed.
+async def rate(session, appointment_id: int, specialist_id: int, score: int):
+    client_id = await session.scalar(
+        select(Appointment.client_id)
+        .where(Appointment.id == appointment_id, Appointment.specialist_id == specialist_id)
+    )
+    if client_id is None:
+        return None, None
+    old = await stats.change_status(session, appointment_id, StatusEnum.completed, expected=StatusEnum.approved)
+    if old is None:
+        return None, None
+    rating = Rating(client_id=client_id, specialist_id=specialist_id, score=score)
+    session.add(rating)
+    # Running average in one statement: the right-hand side sees the pre-update row
+    await session.execute(
+        update(Client)
+        .where(Client.id == client_id)
+        .values(
+            rating=(func.coalesce(Client.rating, 0) * func.coalesce(Client.ratings_count, 0) + score)
+            / (func.coalesce(Client.ratings_count, 0) + 1),
+            ratings_count=func.coalesce(Client.ratings_count, 0) + 1
+        )
+    )
+    await stats.record_rating(session, score, specialist_id)
+    await session.flush()
+    rating_cache.invalidate(specialist_id)
+    return rating, old
+
+
+# (count, average) per specialist id, read from the stat_counters rollup
+async def specialist_ratings(session, specialist_ids):
+    result = {}
+    missing = []
+    for spec_id in specialist_ids:
+        cached = rating_cache.get(spec_id)
+        if cached is MISSING:
+            missing.append(spec_id)
+        else:
+            result[spec_id] = cached
+    if missing:
+        res = await session.execute(
+            select(StatCounter.name, StatCounter.key, StatCounter.value).where(
+                StatCounter.name.in_([stats.SPECIALIST_RATING_SUM, stats.SPECIALIST_RATING_COUNT]),
+                StatCounter.key.in_([str(spec_id) for spec_id in missing])
+            )
+        )
+        sums, counts = {}, {}
+        for name, key, value in res.all():
+            (sums if name == stats.SPECIALIST_RATING_SUM else counts)[int(key)] = value
+        for spec_id in missing:
+            count = counts.get(spec_id, 0)
+            result[spec_id] = (count, sums.get(spec_id, 0) / count if count else 0.0)
+            rating_cache.set(spec_id, result[spec_id])
+    return result
+
+
+async def specialist_rating(session, specialist_id: int):
+    return (await specialist_ratings(session, [specialist_id]))[specialist_id]
+
+
+# Rebuild Client.rating/ratings_count and the rollups from the Rating table,
+# walking clients by id in chunks so no statement touches the whole table
+async def recompute(session, chunk: int = RATING_CHUNK):
+    last_id = 0
+    updated = 0
+    while True:
+        ids = (await session.execute(
+            select(Client.id).where(Client.id > last_id).order_by(Client.id).limit(chunk)
+        )).scalars().all()
+        if not ids:
+            break
+        res = await session.execute(
+            select(Rating.client_id, func.avg(Rating.score), func.count(Rating.id))
+            .where(Rating.client_id.between(ids[0], ids[-1]))
+            .group_by(Rating.client_id)
+        )
+        aggregates = {client_id: (avg, count) for client_id, avg, count in res.all()}
+        await session.execute(update(Client), [
+            {'id': client_id, 'rating': float(aggregates.get(client_id, (0, 0))[0]),
+             'ratings_count': aggregates.get(client_id, (0, 0))[1]}
+            for client_id in ids
+        ])
+        await session.commit()
+        updated += len(ids)
+        last_id = ids[-1]
+    await stats.rebuild_ratings(session)
+    await session.commit()
+    rating_cache.clear()
+    return updated
@@ -0,0 +1,46 @@
+#repository.py
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, load_only
+from database import Appointment, Client, Specialist
+
+# Load profiles: every screen gets exactly the columns and relations it renders,
+# so it costs a fixed number of queries and never lazy-loads after the session closes
+LOAD_PROFILES = {
+    # Мои заявки
+    'client_appointments': (
+        load_only(Appointment.id, Appointment.created_at, Appointment.status),
+    ),
+    # Расписание: one JOIN for client names
+    'schedule': (
+        load_only(Appointment.id, Appointment.date),
+        joinedload(Appointment.client).load_only(Client.name),
+    ),
+    # Новая задача / одобрение заявки
+    'task_card': (
+        joinedload(Appointment.client),
+        joinedload(Appointment.specialist),
+    ),
+}
+
+
+def appointments(profile: str):
+    return select(Appointment).options(*LOAD_PROFILES[profile])
+
+
+async def get_appointment(session, appointment_id: int, profile: str):
+    res = await session.execute(
+        appointments(profile).where(Appointment.id == appointment_id)
+    )
+    return res.scalar_one_or_none()
+
+
+async def get_client_id(session, telegram_id: int):
+    return await session.scalar(
+        select(Client.id).where(Client.telegram_id == telegram_id)
+    )
+
+
+async def get_specialist_id(session, telegram_id: int):
+    return await session.scalar(
+        select(Specialist.id).where(Specialist.telegram_id == telegram_id, Specialist.is_active == True)
+    )
@@ -0,0 +1,63 @@
+#roster.py
+import csv
+import json
+from sqlalchemy import select, update, case
+from config import SPECIALISTS, ROSTER_PATH
+from database import Specialist, dialect_insert
+
+CHUNK_SIZE = 500
+
+
+# Specialists from ROSTER_PATH (CSV with telegram_id,name,username,city columns or a JSON list), else from config
+def load_roster():
+    if not ROSTER_PATH:
+        return [
+            {'telegram_id': int(tg_id), 'name': data['name'], 'username': data['username'], 'city': data.get('city')}
+            for tg_id, data in SPECIALISTS.items()
+        ]
+    with open(ROSTER_PATH, encoding='utf-8', newline='') as f:
+        if ROSTER_PATH.endswith('.json'):
+            items = json.load(f)
+        else:
+            items = list(csv.DictReader(f))
+    return [
+        {
+            'telegram_id': int(item['telegram_id']),
+            'name': item['name'],
+            'username': item.get('username'),
+            'city': item.get('city') or None,
+        }
+        for item in items
+    ]
+
+
+# Upserts the roster and deactivates specialists missing from it
+async def sync_specialists(session, roster):
+    roster_ids = {row['telegram_id'] for row in roster}
+    if roster:
+        stmt = dialect_insert(Specialist)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Specialist.telegram_id],
+            set_={
+                'name': stmt.excluded.name,
+                'username': stmt.excluded.username,
+                'city': stmt.excluded.city,
+                'is_active': True,
+                # Deactivation also cleared availability; a returning specialist starts available,
+                # active ones keep their own toggle
+                'is_available': case((Specialist.is_active == False, True), else_=Specialist.is_available),
+            }
+        )
+        # executemany: one compiled statement, rows sent in driver batches
+        await session.execute(stmt, [dict(row, is_active=True) for row in roster])
+    res = await session.execute(
+        select(Specialist.telegram_id).where(Specialist.is_active == True)
+    )
+    removed = [tg_id for tg_id in res.scalars() if tg_id not in roster_ids]
+    for start in range(0, len(removed), CHUNK_SIZE):
+        await session.execute(
+            update(Specialist)
+            .where(Specialist.telegram_id.in_(removed[start:start + CHUNK_SIZE]))
+            .values(is_active=False, is_available=False)
+        )
+    return len(roster), len(removed)
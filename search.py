@@ -0,0 +1,122 @@
+#search.py
+from sqlalchemy import select, text, func, literal_column, Integer, Float
+from config import PAGE_SIZE
+from database import engine, Client, Appointment
+
+# Admin search over clients and appointment descriptions.
+# SQLite: external-content FTS5 tables kept in sync by triggers; clients use the trigram
+# tokenizer so serial and phone fragments match. Postgres: pg_trgm and tsvector GIN indexes.
+CLIENT_FIELDS = ('name', 'city', 'phone', 'serial_number', 'product_type')
+MIN_TERM = 3
+
+SQLITE_SCHEMA = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS clients_fts USING fts5("
+    f"{', '.join(CLIENT_FIELDS)}, content='clients', content_rowid='id', tokenize='trigram')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS appointments_fts USING fts5("
+    "description, content='appointments', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+]
+
+
+def _sqlite_triggers(table: str, fields):
+    new = ', '.join(f'new.{field}' for field in fields)
+    old = ', '.join(f'old.{field}' for field in fields)
+    columns = ', '.join(fields)
+    insert = f"INSERT INTO {table}_fts(rowid, {columns}) VALUES (new.id, {new});"
+    delete = f"INSERT INTO {table}_fts({table}_fts, rowid, {columns}) VALUES ('delete', old.id, {old});"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN {delete} END",
+        # Only searchable columns: rating and status updates don't touch the index
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE OF {columns} ON {table} "
+        f"BEGIN {delete} {insert} END",
+    ]
+
+
+CLIENT_DOCUMENT = " || ' ' || ".join(f"coalesce({field}, '')" for field in CLIENT_FIELDS)
+
+POSTGRES_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_clients_search_trgm ON clients USING gin (({CLIENT_DOCUMENT}) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_appointments_search_tsv ON appointments "
+    "USING gin (to_tsvector('russian', coalesce(description, '')))",
+]
+
+
+def _create_sqlite(sync_conn):
+    existing = {row[0] for row in sync_conn.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE name IN ('clients_fts', 'appointments_fts')"
+    )}
+    for statement in SQLITE_SCHEMA + _sqlite_triggers('clients', CLIENT_FIELDS) + \
+            _sqlite_triggers('appointments', ('description',)):
+        sync_conn.exec_driver_sql(statement)
+    # Index rows written before search existed
+    for table in ('clients_fts', 'appointments_fts'):
+        if table not in existing:
+            sync_conn.exec_driver_sql(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+
+
+def _create_postgres(sync_conn):
+    for statement in POSTGRES_SCHEMA:
+        sync_conn.exec_driver_sql(statement)
+
+
+def create_schema(sync_conn):
+    if sync_conn.dialect.name == 'postgresql':
+        _create_postgres(sync_conn)
+    else:
+        _create_sqlite(sync_conn)
+
+
+def terms(query: str):
+    return [term for term in query.split() if len(term) >= MIN_TERM]
+
+
+def _match(query: str, prefix: bool = False):
+    # Every term quoted, so user input can't use FTS5 query syntax; prefix terms catch word endings
+    suffix = '*' if prefix else ''
+    return ' '.join('"' + term.replace('"', '""') + '"' + suffix for term in terms(query))
+
+
+def _client_stmt(query: str):
+    if engine.dialect.name == 'postgresql':
+        document = literal_column(f"({CLIENT_DOCUMENT})")
+        stmt = select(Client)
+        for term in terms(query):
+            stmt = stmt.where(document.ilike(f'%{term}%'))
+        return stmt.order_by(func.similarity(document, query).desc(), Client.id)
+    ranked = text(
+        "SELECT rowid AS id, bm25(clients_fts) AS rank FROM clients_fts WHERE clients_fts MATCH :q"
+    ).bindparams(q=_match(query)).columns(id=Integer, rank=Float).subquery()
+    return select(Client).join(ranked, Client.id == ranked.c.id).order_by(ranked.c.rank, Client.id)
+
+
+def _appointment_stmt(query: str):
+    if engine.dialect.name == 'postgresql':
+        vector = func.to_tsvector('russian', func.coalesce(Appointment.description, ''))
+        tsquery = func.plainto_tsquery('russian', query)
+        return (
+            select(Appointment)
+            .where(vector.op('@@')(tsquery))
+            .order_by(func.ts_rank(vector, tsquery).desc(), Appointment.id.desc())
+        )
+    ranked = text(
+        "SELECT rowid AS id, bm25(appointments_fts) AS rank FROM appointments_fts "
+        "WHERE appointments_fts MATCH :q"
+    ).bindparams(q=_match(query, prefix=True)).columns(id=Integer, rank=Float).subquery()
+    return (
+        select(Appointment)
+        .join(ranked, Appointment.id == ranked.c.id)
+        .order_by(ranked.c.rank, Appointment.id.desc())
+    )
+
+
+# One ranked page of clients and of appointments; fetches limit + 1 to know if there is more
+async def search(session, query: str, offset: int = 0, limit: int = PAGE_SIZE):
+    clients = (await session.execute(
+        _client_stmt(query).offset(offset).limit(limit + 1)
+    )).scalars().all()
+    apps = (await session.execute(
+        _appointment_stmt(query).offset(offset).limit(limit + 1)
+    )).scalars().all()
+    has_more = len(clients) > limit or len(apps) > limit
+    return clients[:limit], apps[:limit], has_more
@@ -0,0 +1,223 @@
+#sharding.py
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import queue as queues
+import signal
+import time
+import aiohttp
+import config
+
+# Sharded mode: one ingress process polls Telegram and routes each update to one of N worker
+# processes by consistent hashing on the user id. A user always lands on the same worker, which
+# runs that user's updates one at a time, so FSM transitions keep their order.
+# Start it with `python sharding.py` (bot.py hands over to it when MODE = "sharded"): spawned
+# workers re-import the main module, which therefore must not import the bot itself.
+
+
+class HashRing:
+    def __init__(self, nodes, replicas: int = 100):
+        self.ring = sorted((self._hash(f'{node}:{i}'), node) for node in nodes for i in range(replicas))
+        self.keys = [key for key, _ in self.ring]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(str(key).encode()).digest()[:8], 'big')
+
+    def get(self, key):
+        # Changing the node count moves only ~1/N of the keys
+        return self.ring[bisect.bisect(self.keys, self._hash(key)) % len(self.ring)][1]
+
+
+def update_user_id(data: dict):
+    # The update's only payload object carries the sender: message, callback_query, ...
+    for value in data.values():
+        if isinstance(value, dict):
+            user = value.get('from') or value.get('user') or value.get('chat') or {}
+            return user.get('id')
+    return None
+
+
+# Worker process
+
+def worker_main(index: int, shards: int, queue, ready, overrides: dict):
+    for key, value in overrides.items():
+        setattr(config, key, value)
+    config.MODE = 'sharded'
+    config.SHARD_INDEX = index
+    config.SHARDS = shards
+    # Telegram's global limit is per bot, so the workers split it
+    config.OUTBOX_GLOBAL_RATE = config.OUTBOX_GLOBAL_RATE / shards
+    asyncio.run(_worker(index, queue, ready))
+
+
+async def _worker(index: int, queue, ready):
+    # Imported after the config overrides are applied
+    import bot as app
+    from aiogram.types import Update
+    logging.getLogger().name = f'shard-{index}'
+    app.dp.startup.register(app.on_startup)
+    app.dp.shutdown.register(app.on_shutdown)
+    await app.dp.emit_startup(bot=app.bot, dispatcher=app.dp)
+    ready.set()
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(config.WEBHOOK_MAX_CONCURRENCY)
+    locks = {}
+    tasks = set()
+
+    async def process(data):
+        user_id = update_user_id(data)
+        entry = locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                update = Update.model_validate(data, context={'bot': app.bot})
+                await app.dp.feed_update(app.bot, update)
+        except Exception as e:
+            logging.error(f"Шард {index}: ошибка обработки обновления {data.get('update_id')}: {e}", exc_info=True)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                locks.pop(user_id, None)
+            semaphore.release()
+
+    running = True
+    while running:
+        # One blocking get, then whatever else is already queued
+        batch = [await loop.run_in_executor(None, queue.get)]
+        try:
+            while len(batch) < 100:
+                batch.append(queue.get_nowait())
+        except queues.Empty:
+            pass
+        for data in batch:
+            if data is None:
+                running = False
+                break
+            await semaphore.acquire()
+            task = asyncio.create_task(process(data))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+    await app.dp.emit_shutdown(bot=app.bot, dispatcher=app.dp)
+
+
+# Ingress and supervisor
+
+class Supervisor:
+    def __init__(self, shards: int = None, overrides: dict = None):
+        self.shards = shards or config.SHARDS
+        self.overrides = overrides or {}
+        self.ctx = multiprocessing.get_context('spawn')
+        self.queues = [self.ctx.Queue(config.SHARD_QUEUE_SIZE) for _ in range(self.shards)]
+        self.ring = HashRing(range(self.shards))
+        self.processes = [None] * self.shards
+        # Kept referenced until the child has unpickled them
+        self.ready = [None] * self.shards
+        self.restarts = [0] * self.shards
+        self.stopping = asyncio.Event()
+
+    def _spawn(self, index: int):
+        ready = self.ready[index] = self.ctx.Event()
+        process = self.ctx.Process(
+            target=worker_main, name=f'shard-{index}',
+            args=(index, self.shards, self.queues[index], ready, self.overrides)
+        )
+        process.start()
+        self.processes[index] = process
+        return ready
+
+    async def _wait_ready(self, ready, timeout: float = 60):
+        if not await asyncio.to_thread(ready.wait, timeout):
+            raise RuntimeError('Шард не запустился')
+
+    async def start(self):
+        if config.FSM_STORAGE == 'memory':
+            logging.warning("Шарды: FSM в памяти теряется при перезапуске воркера, лучше FSM_STORAGE='sqlite' или 'redis'")
+        # Shard 0 owns schema setup, roster sync, jobs and broadcasts, so it starts first
+        await self._wait_ready(self._spawn(0))
+        await asyncio.gather(*(self._wait_ready(self._spawn(i)) for i in range(1, self.shards)))
+        logging.info(f"Запущено шардов: {self.shards}")
+
+    async def dispatch(self, data: dict):
+        index = self.ring.get(update_user_id(data) or 0)
+        try:
+            self.queues[index].put_nowait(data)
+        except queues.Full:
+            # Backpressure: stop polling until the worker catches up
+            await asyncio.to_thread(self.queues[index].put, data)
+
+    async def watch(self, interval: float = 1):
+        while not self.stopping.is_set():
+            for index, process in enumerate(self.processes):
+                if process is not None and not process.is_alive() and not self.stopping.is_set():
+                    self.restarts[index] += 1
+                    logging.error(f"Шард {index} завершился с кодом {process.exitcode}, перезапуск #{self.restarts[index]}")
+                    # Back off on crash loops, up to a minute
+                    await asyncio.sleep(min(2 ** (self.restarts[index] - 1), 60))
+                    # A killed worker may hold the queue's reader lock, so it gets a fresh queue;
+                    # updates still queued for it are lost
+                    self.queues[index].cancel_join_thread()
+                    self.queues[index] = self.ctx.Queue(config.SHARD_QUEUE_SIZE)
+                    self._spawn(index)
+            try:
+                await asyncio.wait_for(self.stopping.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def poll(self):
+        base = (config.API_SERVER or 'https://api.telegram.org').rstrip('/')
+        url = f'{base}/bot{config.API_TOKEN}/getUpdates'
+        offset = None
+        async with aiohttp.ClientSession() as http:
+            while not self.stopping.is_set():
+                params = {'timeout': 30} if offset is None else {'timeout': 30, 'offset': offset}
+                try:
+                    async with http.post(url, json=params, timeout=aiohttp.ClientTimeout(total=40)) as response:
+                        body = await response.json()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logging.warning(f"Шарды: ошибка getUpdates: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                for data in body.get('result', []):
+                    offset = data['update_id'] + 1
+                    await self.dispatch(data)
+
+    async def stop(self, timeout: float = 30):
+        self.stopping.set()
+        # Workers drain their queues up to the sentinel, then shut down cleanly
+        for q in self.queues:
+            await asyncio.to_thread(q.put, None)
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            if process is not None:
+                await asyncio.to_thread(process.join, max(deadline - time.monotonic(), 0))
+                if process.is_alive():
+                    process.terminate()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stopping.set)
+        await self.start()
+        watcher = asyncio.create_task(self.watch())
+        poller = asyncio.create_task(self.poll())
+        await self.stopping.wait()
+        poller.cancel()
+        await asyncio.gather(poller, return_exceptions=True)
+        await self.stop()
+        await watcher
+
+
+def run_sharded(shards: int = None):
+    asyncio.run(Supervisor(shards).run())
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_sharded()
@@ -0,0 +1,77 @@
+#slots.py
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from database import Appointment, StatusEnum
+
+
+# Approved appointment start times per specialist, kept sorted for bisect lookups.
+# Every appointment occupies [start, start + duration).
+class SlotIndex:
+    def __init__(self, duration: timedelta):
+        self.duration = duration
+        self._starts = {}
+
+    def clear(self):
+        self._starts.clear()
+
+    def add(self, specialist_id: int, start: datetime):
+        insort(self._starts.setdefault(specialist_id, []), start)
+
+    def remove(self, specialist_id: int, start: datetime):
+        starts = self._starts.get(specialist_id)
+        if not starts:
+            return
+        i = bisect_left(starts, start)
+        if i < len(starts) and starts[i] == start:
+            del starts[i]
+
+    def count_between(self, specialist_id: int, lo: datetime, hi: datetime):
+        starts = self._starts.get(specialist_id)
+        if not starts:
+            return 0
+        return bisect_right(starts, hi) - bisect_left(starts, lo)
+
+    def has_conflict(self, specialist_id: int, start: datetime):
+        starts = self._starts.get(specialist_id)
+        if not starts:
+            return False
+        # Overlap means another start lies strictly within one duration of ours
+        i = bisect_right(starts, start - self.duration)
+        return i < len(starts) and starts[i] < start + self.duration
+
+    def is_free(self, specialist_id: int, start: datetime):
+        return not self.has_conflict(specialist_id, start)
+
+    def next_free(self, specialist_id: int, start: datetime):
+        starts = self._starts.get(specialist_id)
+        if not starts:
+            return start
+        # Skip forward past every booking that overlaps the candidate slot
+        i = bisect_right(starts, start - self.duration)
+        while i < len(starts) and starts[i] < start + self.duration:
+            start = max(start, starts[i] + self.duration)
+            i += 1
+        return start
+
+    def who_is_free(self, specialist_ids, start: datetime):
+        return [spec_id for spec_id in specialist_ids if not self.has_conflict(spec_id, start)]
+
+    async def load(self, session, since: datetime, until: datetime = None, specialist_id: int = None):
+        self.clear()
+        query = (
+            select(Appointment.specialist_id, Appointment.date)
+            .where(
+                Appointment.status == StatusEnum.approved,
+                Appointment.specialist_id.isnot(None),
+                Appointment.date >= since - self.duration
+            )
+            .order_by(Appointment.date)
+        )
+        if until is not None:
+            query = query.where(Appointment.date <= until)
+        if specialist_id is not None:
+            query = query.where(Appointment.specialist_id == specialist_id)
+        res = await session.execute(query)
+        for specialist_id, start in res.all():
+            self._starts.setdefault(specialist_id, []).append(start)
@@ -0,0 +1,97 @@
+#startup_profile.py
+# Boots the bot in polling mode against a local mock Bot API and reports the time
+# from process start to the first handled update, broken down by phase:
+#   python startup_profile.py            # cold boot (fresh database), then warm boot
+#   python startup_profile.py --db bot.db
+import time
+started = time.perf_counter()
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+async def boot(args):
+    import config
+    # Patch config before the bot modules read it
+    config.DB_URL = f"sqlite+aiosqlite:///{args.db}"
+    config.JOBSTORE_URL = f"sqlite:///{args.db}.jobs"
+    config.FSM_STORAGE = 'memory'
+    config.METRICS_PORT = None
+    config.MODE = 'polling'
+
+    phases = {}
+    mark = time.perf_counter()
+    for name in ('aiogram', 'sqlalchemy', 'bot'):
+        __import__(name)
+        phases[f'import {name}'] = time.perf_counter() - mark
+        mark = time.perf_counter()
+    import bot as app
+    import metrics
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from loadtest import MockTelegramAPI, message_update
+
+    # Serves a single /start on the first getUpdates and waits for the reply
+    class FirstUpdateAPI(MockTelegramAPI):
+        def __init__(self):
+            super().__init__()
+            self.pending = [message_update(1, 100001, '/start')]
+            self.replied = asyncio.Event()
+
+        async def handle(self, request):
+            method = request.match_info['method'].lower()
+            if method == 'getupdates':
+                from aiohttp import web
+                updates, self.pending = self.pending, []
+                if not updates:
+                    await asyncio.sleep(0.05)
+                return web.json_response({'ok': True, 'result': updates})
+            if method == 'sendmessage':
+                self.replied.set()
+            return await super().handle(request)
+
+    api = FirstUpdateAPI()
+    base = await api.start()
+    bot = Bot(token='42:PROFILE', session=AiohttpSession(api=TelegramAPIServer.from_base(base)))
+    app.dp.startup.register(app.on_startup)
+    app.dp.shutdown.register(app.on_shutdown)
+    mark = time.perf_counter()
+    polling = asyncio.create_task(app.dp.start_polling(bot, handle_signals=False, polling_timeout=1))
+    await api.replied.wait()
+    first_update = time.perf_counter()
+    phases.update({f'startup {name}': seconds for name, seconds in metrics.startup_phases.items()})
+    phases['startup total'] = sum(metrics.startup_phases.values())
+    phases['first update'] = first_update - mark - phases['startup total']
+    phases['time to first update'] = first_update - started
+    await app.dp.stop_polling()
+    await polling
+    await bot.session.close()
+    await api.stop()
+    print(json.dumps(phases))
+
+
+def run(db: str):
+    output = subprocess.run(
+        [sys.executable, __file__, '--child', '--db', db], check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Startup profiler')
+    parser.add_argument('--db', default='', help='SQLite database to boot against; a fresh one by default')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        asyncio.run(boot(args))
+        sys.exit()
+    db = args.db or os.path.join(tempfile.mkdtemp(prefix='startup-'), 'bot.db')
+    boots = [('cold' if not os.path.exists(db) else 'warm', run(db)), ('warm', run(db))]
+    print(f"{'phase':<24}" + ''.join(f'{label:>10}' for label, _ in boots))
+    for phase in boots[0][1]:
+        print(f'{phase:<24}' + ''.join(f'{timings.get(phase, 0) * 1000:>8.0f}ms' for _, timings in boots))
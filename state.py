@@ -1,4 +1,4 @@
-#states.py
+#state.py
 from aiogram.fsm.state import State, StatesGroup
 
 class ClientStates(StatesGroup):
@@ -0,0 +1,145 @@
+#stats.py
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, func, or_, and_
+from database import StatCounter, Appointment, Client, Rating, StatusEnum, dialect_insert
+
+# Counter dimensions kept in stat_counters(name, key, value)
+STATUS = 'status'          # appointments per status
+SPECIALIST = 'specialist'  # approved appointments per specialist id
+CITY = 'city'              # appointments per client city
+DAY = 'day'                # appointments created per day
+CLIENTS = 'clients'        # registered clients
+RATINGS = 'ratings'        # sum/count of client ratings
+SPECIALIST_RATING_SUM = 'specialist_rating_sum'      # sum of scores given, per specialist id
+SPECIALIST_RATING_COUNT = 'specialist_rating_count'  # number of scores given, per specialist id
+# Dimensions load() returns in full; DAY is limited to recent days
+DASHBOARD = (STATUS, SPECIALIST, CITY, CLIENTS, RATINGS)
+
+
+async def bump(session, name: str, key, delta: int = 1):
+    stmt = dialect_insert(StatCounter).values(name=name, key=str(key), value=delta)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[StatCounter.name, StatCounter.key],
+        set_={'value': StatCounter.value + delta}
+    )
+    await session.execute(stmt)
+
+
+async def record_client(session):
+    await bump(session, CLIENTS, 'total')
+
+
+async def record_appointment(session, appointment: Appointment, city: str):
+    await bump(session, STATUS, appointment.status.value)
+    await bump(session, CITY, city or '—')
+    await bump(session, DAY, appointment.created_at.strftime('%Y-%m-%d'))
+
+
+async def record_rating(session, score: int, specialist_id: int = None):
+    await bump(session, RATINGS, 'sum', score)
+    await bump(session, RATINGS, 'count')
+    if specialist_id:
+        await bump(session, SPECIALIST_RATING_SUM, specialist_id, score)
+        await bump(session, SPECIALIST_RATING_COUNT, specialist_id)
+
+
+# Every Appointment.status change goes through here so the counters stay exact.
+# Returns the previous (status, specialist_id, date) row, or None if the appointment is missing,
+# is not in the `expected` status, or was changed concurrently.
+async def change_status(session, appointment_id: int, status: StatusEnum, expected: StatusEnum = None, **values):
+    res = await session.execute(
+        select(Appointment.status, Appointment.specialist_id, Appointment.date)
+        .where(Appointment.id == appointment_id)
+    )
+    row = res.one_or_none()
+    if row is None or (expected is not None and row.status != expected):
+        return None
+    old_status, old_spec, _ = row
+    res = await session.execute(
+        update(Appointment)
+        .where(Appointment.id == appointment_id, Appointment.status == old_status)
+        .values(status=status, **values)
+    )
+    if not res.rowcount:
+        return None
+    new_spec = values.get('specialist_id', old_spec)
+    if old_status != status:
+        await bump(session, STATUS, old_status.value, -1)
+        await bump(session, STATUS, status.value)
+    if (old_status, old_spec) != (status, new_spec):
+        if old_status == StatusEnum.approved and old_spec:
+            await bump(session, SPECIALIST, old_spec, -1)
+        if status == StatusEnum.approved and new_spec:
+            await bump(session, SPECIALIST, new_spec)
+    return row
+
+
+# Full recompute with grouped aggregates, one query per dimension
+async def rebuild(session):
+    groups = [
+        (STATUS, select(Appointment.status, func.count()).group_by(Appointment.status)),
+        (SPECIALIST, select(Appointment.specialist_id, func.count())
+            .where(Appointment.status == StatusEnum.approved, Appointment.specialist_id.isnot(None))
+            .group_by(Appointment.specialist_id)),
+        (CITY, select(func.coalesce(Client.city, '—'), func.count())
+            .select_from(Appointment)
+            .join(Client, Appointment.client_id == Client.id)
+            .group_by(Client.city)),
+        (DAY, select(func.date(Appointment.created_at), func.count())
+            .group_by(func.date(Appointment.created_at))),
+    ]
+    rows = []
+    for name, stmt in groups:
+        for key, value in (await session.execute(stmt)).all():
+            if isinstance(key, StatusEnum):
+                key = key.value
+            rows.append({'name': name, 'key': str(key), 'value': value})
+    rows.append({'name': CLIENTS, 'key': 'total', 'value': await session.scalar(select(func.count(Client.id)))})
+    rows += await rating_rows(session)
+    await session.execute(delete(StatCounter))
+    await session.execute(dialect_insert(StatCounter), rows)
+
+
+async def rating_rows(session):
+    res = await session.execute(select(func.coalesce(func.sum(Rating.score), 0), func.count(Rating.id)))
+    rating_sum, rating_count = res.one()
+    rows = [
+        {'name': RATINGS, 'key': 'sum', 'value': rating_sum},
+        {'name': RATINGS, 'key': 'count', 'value': rating_count},
+    ]
+    res = await session.execute(
+        select(Rating.specialist_id, func.sum(Rating.score), func.count(Rating.id))
+        .where(Rating.specialist_id.isnot(None))
+        .group_by(Rating.specialist_id)
+    )
+    for spec_id, score_sum, count in res.all():
+        rows.append({'name': SPECIALIST_RATING_SUM, 'key': str(spec_id), 'value': score_sum})
+        rows.append({'name': SPECIALIST_RATING_COUNT, 'key': str(spec_id), 'value': count})
+    return rows
+
+
+# Recompute only the rating dimensions, for the periodic rating job
+async def rebuild_ratings(session):
+    rows = await rating_rows(session)
+    await session.execute(
+        delete(StatCounter).where(StatCounter.name.in_([RATINGS, SPECIALIST_RATING_SUM, SPECIALIST_RATING_COUNT]))
+    )
+    await session.execute(dialect_insert(StatCounter), rows)
+
+
+async def is_empty(session):
+    return await session.scalar(select(StatCounter.name).limit(1)) is None
+
+
+async def load(session, days: int = 7):
+    since = (datetime.now() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    res = await session.execute(
+        select(StatCounter.name, StatCounter.key, StatCounter.value).where(
+            # Both branches search the (name, key) primary key
+            or_(StatCounter.name.in_(DASHBOARD), and_(StatCounter.name == DAY, StatCounter.key >= since))
+        )
+    )
+    result = {}
+    for name, key, value in res.all():
+        result.setdefault(name, {})[key] = value
+    return result
@@ -0,0 +1,144 @@
+#storage.py
+import asyncio
+import json
+import sqlite3
+import time
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+from config import FSM_STORAGE, FSM_SQLITE_PATH, FSM_FLUSH_INTERVAL, FSM_CACHE_TTL, REDIS_URL
+
+
+def _make_key(key):
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+
+# SQLite storage: reads are served from memory for up to `ttl` seconds, writes are flushed in batches.
+# Workers sharing the file see each other's writes after at most flush_interval + ttl; with sticky
+# per-user routing (sharded mode) a user's state only ever changes in one worker and is always exact.
+class SQLiteStorage(BaseStorage):
+    def __init__(self, path: str, flush_interval: float = 0.5, ttl: float = 1.0):
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS fsm (key TEXT PRIMARY KEY, state TEXT, data TEXT)'
+        )
+        self._conn.commit()
+        self._states = {}
+        self._data = {}
+        self._dirty = set()
+        # key -> monotonic time it was last read from or written to SQLite
+        self._loaded = {}
+        # key -> number of the last local write, until that write is flushed
+        self._unsaved = {}
+        self._writes = 0
+        self._io_lock = asyncio.Lock()
+        self._flusher = None
+
+    def _read(self, key):
+        row = self._conn.execute('SELECT state, data FROM fsm WHERE key = ?', (key,)).fetchone()
+        if not row:
+            return None, {}
+        return row[0], json.loads(row[1]) if row[1] else {}
+
+    def _write(self, rows):
+        with self._conn:
+            self._conn.executemany(
+                'INSERT INTO fsm (key, state, data) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data',
+                [row for row in rows if row[1] is not None or row[2] != '{}']
+            )
+            self._conn.executemany(
+                'DELETE FROM fsm WHERE key = ?',
+                [(row[0],) for row in rows if row[1] is None and row[2] == '{}']
+            )
+
+    async def _load(self, key):
+        # Our own unflushed write is newer than anything stored
+        if key in self._unsaved:
+            return
+        loaded = self._loaded.get(key)
+        if loaded is not None and time.monotonic() - loaded < self.ttl:
+            return
+        async with self._io_lock:
+            state, data = await asyncio.to_thread(self._read, key)
+        # A write may have landed while we were reading
+        if key not in self._unsaved:
+            self._states[key] = state
+            self._data[key] = data
+            self._loaded[key] = time.monotonic()
+
+    def _mark_dirty(self, key):
+        self._writes += 1
+        self._unsaved[key] = self._writes
+        self._dirty.add(key)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+        rows = []
+        written = {}
+        for key in keys:
+            state = self._states.get(key)
+            data = self._data.get(key, {})
+            rows.append((key, state, json.dumps(data)))
+            written[key] = self._unsaved.get(key)
+            # Idle keys don't need to stay in memory once persisted
+            if state is None and not data:
+                self._states.pop(key, None)
+                self._data.pop(key, None)
+                self._loaded.pop(key, None)
+        async with self._io_lock:
+            await asyncio.to_thread(self._write, rows)
+        now = time.monotonic()
+        for key, write in written.items():
+            if self._unsaved.get(key) == write:
+                del self._unsaved[key]
+                if key in self._data:
+                    self._loaded[key] = now
+
+    async def set_state(self, key, state=None):
+        key = _make_key(key)
+        await self._load(key)
+        self._states[key] = state.state if isinstance(state, State) else state
+        self._mark_dirty(key)
+
+    async def get_state(self, key):
+        key = _make_key(key)
+        await self._load(key)
+        return self._states.get(key)
+
+    async def set_data(self, key, data):
+        key = _make_key(key)
+        await self._load(key)
+        self._data[key] = dict(data)
+        self._mark_dirty(key)
+
+    async def get_data(self, key):
+        key = _make_key(key)
+        await self._load(key)
+        return dict(self._data.get(key, {}))
+
+    async def close(self):
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        await self.flush()
+        self._conn.close()
+
+
+def create_storage():
+    if FSM_STORAGE == 'sqlite':
+        return SQLiteStorage(FSM_SQLITE_PATH, FSM_FLUSH_INTERVAL, FSM_CACHE_TTL)
+    if FSM_STORAGE == 'redis':
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(REDIS_URL)
+    return MemoryStorage()
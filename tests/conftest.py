@@ -0,0 +1,132 @@
+#tests/conftest.py
+# The bot wired to a temp SQLite database and a local mock Bot API, as loadtest.py runs it.
+# No pytest plugins: tests drive coroutines through harness.run() on one session-wide loop.
+import asyncio
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+
+TMP = tempfile.mkdtemp(prefix='tests-')
+# Patch config before the bot modules read it
+config.DB_URL = f"sqlite+aiosqlite:///{os.path.join(TMP, 'test.db')}"
+config.JOBSTORE_URL = f"sqlite:///{os.path.join(TMP, 'jobs.db')}"
+config.FSM_STORAGE = 'memory'
+config.OUTBOX_GLOBAL_RATE = 1e6
+config.OUTBOX_CHAT_RATE = 1e6
+config.METRICS_PORT = None
+config.MODE = 'polling'
+config.ROSTER_PATH = None
+config.SPECIALISTS = {
+    111: {'name': 'Специалист 1', 'username': '@spec1', 'city': 'Москва'},
+    222: {'name': 'Специалист 2', 'username': '@spec2', 'city': 'Казань'},
+}
+DB_PATH = os.path.join(TMP, 'test.db')
+
+
+class Harness:
+    def __init__(self, loop):
+        self.loop = loop
+        self.update_id = 0
+        self.statements = None
+
+    def run(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    async def start(self):
+        from aiogram import Bot
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+        from sqlalchemy import event
+        from loadtest import MockTelegramAPI
+        import bot as app
+        import database
+        self.app = app
+        self.database = database
+        self.api = MockTelegramAPI()
+        base = await self.api.start()
+        self.bot = Bot(token='42:TESTS', session=AiohttpSession(api=TelegramAPIServer.from_base(base)))
+        await app.on_startup(self.bot)
+        event.listen(database.engine.sync_engine, 'before_cursor_execute', self._record)
+
+    async def stop(self):
+        await self.app.on_shutdown()
+        await self.bot.session.close()
+        await self.api.stop()
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if self.statements is not None:
+            self.statements.append((statement, parameters[0] if executemany else parameters))
+
+    @contextmanager
+    def capture(self):
+        # (SQL, parameters) of every statement executed inside the block
+        self.statements = []
+        try:
+            yield self.statements
+        finally:
+            self.statements = None
+
+    def feed(self, payload: dict):
+        from aiogram.types import Update
+        update = Update.model_validate(payload, context={'bot': self.bot})
+        return self.run(self.app.dp.feed_update(self.bot, update))
+
+    def message(self, user_id: int, text: str):
+        from loadtest import message_update
+        self.update_id += 1
+        return self.feed(message_update(self.update_id, user_id, text))
+
+    def callback(self, user_id: int, data: str):
+        from loadtest import callback_update
+        self.update_id += 1
+        return self.feed(callback_update(self.update_id, user_id, data))
+
+    # Flows shared by the tests
+
+    def register(self, user_id: int, city: str = 'Москва'):
+        self.message(user_id, '/start')
+        for text in (config.CODEWORD, f'Клиент {user_id}', city, 'Завод', 'Станок', f'SN-{user_id}', '+70000000000'):
+            self.message(user_id, text)
+
+    def request(self, user_id: int, text: str):
+        # New appointment from a registered client; returns its id
+        from sqlalchemy import select
+        from database import Appointment, Client
+        self.message(user_id, '📝 Новая заявка')
+        self.message(user_id, text)
+        return self.scalar(
+            select(Appointment.id).join(Client).where(Client.telegram_id == user_id)
+            .order_by(Appointment.id.desc()).limit(1)
+        )
+
+    def approve(self, appointment_id: int, specialist_id: int, date):
+        from callbacks import Confirm, PickSpecialist
+        self.callback(config.ADMIN_ID, Confirm(appointment_id=appointment_id).pack())
+        self.message(config.ADMIN_ID, date.strftime('%d.%m.%Y %H:%M'))
+        self.callback(config.ADMIN_ID, PickSpecialist(specialist_id=specialist_id).pack())
+
+    def specialist_id(self, telegram_id: int):
+        from sqlalchemy import select
+        from database import Specialist
+        return self.scalar(select(Specialist.id).where(Specialist.telegram_id == telegram_id))
+
+    def scalar(self, stmt):
+        async def query():
+            async with self.database.AsyncSessionMaker() as session:
+                return await session.scalar(stmt)
+        return self.run(query())
+
+
+@pytest.fixture(scope='session')
+def harness():
+    loop = asyncio.new_event_loop()
+    harness = Harness(loop)
+    harness.run(harness.start())
+    yield harness
+    harness.run(harness.stop())
+    loop.close()
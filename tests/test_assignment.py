@@ -0,0 +1,54 @@
+#tests/test_assignment.py
+# AssignmentEngine.rank against a full sort of every free specialist
+import random
+from datetime import datetime, timedelta
+import config
+from assignment import AssignmentEngine
+from callbacks import Rate
+from slots import SlotIndex
+
+BASE = datetime(2030, 1, 1, 9, 0)
+CITIES = ['москва', 'казань', 'омск', '']
+
+
+def engine(rng, count):
+    assigner = AssignmentEngine(SlotIndex(timedelta(minutes=60)), timedelta(hours=24))
+    for spec_id in range(1, count + 1):
+        city = rng.choice(CITIES)
+        assigner.specialists[spec_id] = {'name': f'S{spec_id}', 'username': f'@s{spec_id}', 'city': city,
+                                         'available': rng.random() > 0.1}
+        assigner.by_city.setdefault(city, []).append(spec_id)
+    for _ in range(count * 3):
+        assigner.index.add(rng.randint(1, count), BASE + timedelta(minutes=30 * rng.randint(0, 200)))
+    return assigner
+
+
+def full_sort(assigner, date, city):
+    candidates = [c for c in (assigner._candidate(assigner.index, spec_id, date, city) for spec_id in assigner.specialists) if c]
+    return sorted(candidates, key=lambda c: (not c.local, c.load, c.specialist_id))
+
+
+def test_rank_matches_full_sort():
+    rng = random.Random(14)
+    for _ in range(100):
+        assigner = engine(rng, rng.randint(0, 60))
+        for _ in range(10):
+            date = BASE + timedelta(minutes=15 * rng.randint(0, 400))
+            city = rng.choice(CITIES + ['уфа'])
+            expected = full_sort(assigner, date, city)
+            assert assigner.rank(date, city) == expected
+            for limit in (1, 3, 100):
+                assert assigner.rank(date, city, limit=limit) == expected[:limit]
+            assert assigner.best(date, city) == (expected[0] if expected else None)
+
+
+def test_closed_visit_frees_the_slot(harness):
+    from assignment import assigner
+    client, spec_id = 400002, harness.specialist_id(111)
+    start = datetime.now(config.TIMEZONE).replace(minute=0, second=0, microsecond=0, tzinfo=None) + timedelta(days=5)
+    harness.register(client)
+    appointment_id = harness.request(client, 'Визит')
+    harness.approve(appointment_id, spec_id, start)
+    assert not assigner.index.is_free(spec_id, start)
+    harness.callback(111, Rate(score=5, appointment_id=appointment_id).pack())
+    assert assigner.index.is_free(spec_id, start)
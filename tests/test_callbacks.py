@@ -0,0 +1,39 @@
+#tests/test_callbacks.py
+from datetime import datetime
+import config
+from callbacks import decode, Confirm, Rate, Page, PickSpecialist
+
+
+def test_decode_round_trip():
+    assert decode(Confirm(appointment_id=2 ** 63 - 1).pack()) == Confirm(appointment_id=2 ** 63 - 1)
+    assert decode(Rate(score=5, appointment_id=7).pack()) == Rate(score=5, appointment_id=7)
+    assert decode('confirm_12') == Confirm(appointment_id=12)
+    assert decode('c:abc') is None
+    assert decode('') is None
+
+
+def test_unknown_page_view_is_answered(harness):
+    assert decode('pg:zz:1:abc') == Page(view='zz', backward=True, cursor='abc')
+    calls = harness.api.calls
+    harness.callback(111, 'pg:zz:1:abc')
+    # answerCallbackQuery only
+    assert harness.api.calls == calls + 1
+
+
+def test_stale_specialist_pick_is_answered(harness):
+    # No FSM data for this user: the pick must be answered, not raise KeyError
+    calls = harness.api.calls
+    harness.callback(333, PickSpecialist(specialist_id=1).pack())
+    assert harness.api.calls == calls + 1
+
+
+def test_malformed_page_cursor_serves_first_page(harness):
+    from bot import BLACKLIST_KEYSET, SCHEDULE_KEYSET
+    assert BLACKLIST_KEYSET.decode('abc') is None
+    assert SCHEDULE_KEYSET.decode('20300101090000000000') is None
+    assert SCHEDULE_KEYSET.decode('2030x.1') is None
+    assert SCHEDULE_KEYSET.decode('20300101090000000000.7') == [datetime(2030, 1, 1, 9), 7]
+    for user_id, data in ((config.ADMIN_ID, 'pg:bl:0:abc'), (111, 'pg:sched:1:2030x.1'), (111, 'pg:sched:0:1.2.3')):
+        calls = harness.api.calls
+        harness.callback(user_id, data)
+        assert harness.api.calls > calls
@@ -0,0 +1,39 @@
+#tests/test_jobs.py
+# Restarts against one persistent job store must not push scheduled runs back.
+import asyncio
+import time
+from datetime import timedelta
+import jobs
+
+
+def boot():
+    async def start():
+        scheduler = jobs.create_scheduler()
+        scheduler.start(paused=True)
+        jobs.register_jobs(scheduler)
+        schedule = {job.id: (job.next_run_time, job.trigger.interval) for job in scheduler.get_jobs()}
+        scheduler.shutdown(wait=False)
+        return schedule
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(start())
+    finally:
+        loop.close()
+
+
+def test_restart_keeps_next_run_times(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, 'JOBSTORE_URL', f"sqlite:///{tmp_path / 'jobs.db'}")
+    first = boot()
+    assert set(first) == {'send_reminders', 'expire_pending', 'purge_blacklist', 'recompute_ratings'}
+    time.sleep(0.5)
+    assert boot() == first
+
+
+def test_changed_interval_is_rescheduled(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, 'JOBSTORE_URL', f"sqlite:///{tmp_path / 'jobs.db'}")
+    first = boot()
+    monkeypatch.setattr(jobs, 'RATING_RECOMPUTE_HOURS', 12)
+    second = boot()
+    assert second['recompute_ratings'][1] == timedelta(hours=12)
+    assert second['recompute_ratings'][0] != first['recompute_ratings'][0]
+    assert second['send_reminders'] == first['send_reminders']
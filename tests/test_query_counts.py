@@ -0,0 +1,42 @@
+#tests/test_query_counts.py
+# Statements per handler stay fixed as the number of rendered appointments grows (no N+1)
+from datetime import datetime, timedelta
+import config
+
+CLIENT = 400001
+SPECIALIST = 222
+
+# Specialist id lookup + one schedule page with client names joined in
+SCHEDULE_QUERIES = 2
+# Client id lookup + one appointments page
+APPOINTMENTS_QUERIES = 2
+# Status read, guarded UPDATE, 3 counter upserts, task card with client and specialist joined in
+ASSIGN_QUERIES = 6
+
+
+def count(harness, user_id: int, text: str):
+    with harness.capture() as statements:
+        harness.message(user_id, text)
+    return len(statements)
+
+
+def test_queries_per_handler_are_fixed(harness):
+    spec_id = harness.specialist_id(SPECIALIST)
+    start = datetime.now(config.TIMEZONE).replace(minute=0, second=0, microsecond=0, tzinfo=None) + timedelta(days=2)
+    harness.register(CLIENT, 'Казань')
+    # Past a full page, so both screens render PAGE_SIZE rows
+    for n in range(config.PAGE_SIZE + 2):
+        appointment_id = harness.request(CLIENT, f'Заявка {n}')
+
+        async def assign():
+            async with harness.database.AsyncSessionMaker() as session:
+                await harness.app.assign_appointment(
+                    session, appointment_id, spec_id, config.TIMEZONE.localize(start + timedelta(hours=n))
+                )
+
+        with harness.capture() as statements:
+            harness.run(assign())
+        assert len(statements) == ASSIGN_QUERIES
+        if n in (0, config.PAGE_SIZE + 1):
+            assert count(harness, SPECIALIST, '📅 Расписание') == SCHEDULE_QUERIES
+            assert count(harness, CLIENT, '📋 Мои заявки') == APPOINTMENTS_QUERIES
@@ -0,0 +1,108 @@
+#tests/test_query_plans.py
+# EXPLAIN QUERY PLAN for every query shape the handlers and their helpers issue:
+# none may fall back to reading a whole table
+import re
+import sqlite3
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from sqlalchemy import select
+from conftest import DB_PATH
+import config
+import broadcast
+from assignment import assigner
+from database import Broadcast
+from callbacks import Cancel, Rate, Page, SearchPage
+
+CLIENT = 300001
+SPECIALIST = 111
+
+FULL_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)\S+(?! VIRTUAL TABLE)$|^SCAN \S+ USING (COVERING )?INDEX \S+$')
+# Deliberate whole-table reads, by SQL
+ALLOWED = [
+    # Keyset first pages walk the primary key and stop at LIMIT
+    re.compile(r'ORDER BY \w+\.id( ASC| DESC)?\s+LIMIT \?( OFFSET \?)?$'),
+    # The specialists list and the sharded-mode availability refresh read the whole active roster
+    re.compile(r'FROM specialists\s+WHERE specialists\.is_active = 1$'),
+]
+
+
+def plan(sql: str, parameters):
+    with sqlite3.connect(DB_PATH) as conn:
+        return [detail for *_, detail in conn.execute(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()]
+
+
+def assert_indexed(statements):
+    failures = []
+    seen = set()
+    for sql, parameters in statements:
+        sql = sql.strip()
+        if sql in seen or not sql.upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+            continue
+        seen.add(sql)
+        if any(pattern.search(sql) for pattern in ALLOWED):
+            continue
+        details = plan(sql, parameters)
+        if any(FULL_SCAN.match(detail) for detail in details):
+            failures.append(f"{' '.join(sql.split())}\n    " + '\n    '.join(details))
+    assert seen
+    assert not failures, '\n'.join(failures)
+
+
+def test_handler_queries_use_indexes(harness):
+    spec_id = harness.specialist_id(SPECIALIST)
+    hour = datetime.now(config.TIMEZONE).replace(minute=0, second=0, microsecond=0, tzinfo=None)
+    with harness.capture() as statements:
+        harness.register(CLIENT)
+        first = harness.request(CLIENT, 'Не включается станок')
+        harness.approve(first, spec_id, hour + timedelta(days=1))
+        second = harness.request(CLIENT, 'Шумит подшипник')
+        harness.approve(second, spec_id, hour - timedelta(minutes=10))
+        third = harness.request(CLIENT, 'Нужна наладка')
+        harness.callback(config.ADMIN_ID, Cancel(appointment_id=third).pack())
+
+        harness.message(CLIENT, '/start')
+        harness.message(CLIENT, '📋 Мои заявки')
+        cursor = harness.app.APPOINTMENTS_KEYSET.encode(SimpleNamespace(created_at=datetime.now(), id=third))
+        harness.callback(CLIENT, Page(view='apps', backward=False, cursor=cursor).pack())
+
+        harness.message(SPECIALIST, '/start')
+        harness.message(SPECIALIST, '📅 Расписание')
+        cursor = harness.app.SCHEDULE_KEYSET.encode(SimpleNamespace(date=hour, id=second))
+        harness.callback(SPECIALIST, Page(view='sched', backward=True, cursor=cursor).pack())
+        harness.message(SPECIALIST, '✅ Готов к работе')
+        harness.message(SPECIALIST, '📊 Отчеты')
+        harness.callback(SPECIALIST, Rate(score=5, appointment_id=second).pack())
+        harness.message(SPECIALIST, 'Всё отлично')
+
+        harness.message(config.ADMIN_ID, '/start')
+        harness.message(config.ADMIN_ID, '📊 Статистика')
+        harness.message(config.ADMIN_ID, '👥 Специалисты')
+        harness.message(config.ADMIN_ID, '🔨 ЧС')
+        harness.callback(config.ADMIN_ID, Page(view='bl', backward=False, cursor='1').pack())
+        harness.message(config.ADMIN_ID, f'/search SN-{CLIENT}')
+        harness.message(config.ADMIN_ID, '/search подшипник')
+        harness.callback(config.ADMIN_ID, SearchPage(offset=10).pack())
+        harness.message(config.ADMIN_ID, '/broadcast')
+    assert_indexed(statements)
+
+
+def test_module_queries_use_indexes(harness):
+    spec_id = harness.specialist_id(SPECIALIST)
+    now = datetime.now()
+
+    async def queries():
+        async with harness.database.AsyncSessionMaker() as session:
+            item = await broadcast.create(session, 'Проверка', {})
+            await session.commit()
+            for filters in ({}, {'city': 'Москва'}, {'product': 'Станок', 'serial_from': 'SN-1', 'serial_to': 'SN-9'}):
+                await session.execute(broadcast.recipients(item.id, filters, 0, 100))
+            await session.scalar(select(Broadcast.status).where(Broadcast.id == item.id))
+            await broadcast.cancel(session, item.id)
+            await session.commit()
+            await assigner.read_index(session, now, specialist_id=spec_id)
+            await assigner.read_index(session, now - timedelta(minutes=30), now + timedelta(hours=1), spec_id)
+            await assigner.refresh(session, now)
+
+    with harness.capture() as statements:
+        harness.run(queries())
+    assert_indexed(statements)
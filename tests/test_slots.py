@@ -0,0 +1,84 @@
+#tests/test_slots.py
+# SlotIndex against a brute-force scan over the same bookings
+import random
+import time
+from datetime import datetime, timedelta
+from slots import SlotIndex
+
+DURATION = timedelta(minutes=60)
+BASE = datetime(2030, 1, 1, 9, 0)
+
+
+def brute_conflict(starts, start):
+    return any(abs(other - start) < DURATION for other in starts)
+
+
+def brute_next_free(starts, start):
+    # The earliest free start is the requested one or the end of some booking
+    candidates = [start] + [other + DURATION for other in starts if other + DURATION > start]
+    return min(c for c in candidates if not brute_conflict(starts, c))
+
+
+def build(bookings):
+    index = SlotIndex(DURATION)
+    for spec_id, start in bookings:
+        index.add(spec_id, start)
+    return index
+
+
+def test_matches_brute_force():
+    rng = random.Random(15)
+    for _ in range(200):
+        # Quarter-hour grid over two days, so bookings touch, overlap and sit exactly one slot apart
+        bookings = [(rng.randint(1, 4), BASE + timedelta(minutes=15 * rng.randint(0, 192))) for _ in range(rng.randint(0, 40))]
+        index = build(bookings)
+        starts = {spec_id: [start for s, start in bookings if s == spec_id] for spec_id in range(1, 6)}
+        for _ in range(20):
+            start = BASE + timedelta(minutes=5 * rng.randint(-24, 600))
+            for spec_id in range(1, 6):
+                assert index.has_conflict(spec_id, start) == brute_conflict(starts[spec_id], start)
+                assert index.is_free(spec_id, start) != brute_conflict(starts[spec_id], start)
+                assert index.next_free(spec_id, start) == brute_next_free(starts[spec_id], start)
+            assert index.who_is_free(range(1, 6), start) == [
+                spec_id for spec_id in range(1, 6) if not brute_conflict(starts[spec_id], start)
+            ]
+
+
+def test_exactly_one_slot_apart():
+    index = build([(1, BASE)])
+    assert not index.has_conflict(1, BASE + DURATION)
+    assert not index.has_conflict(1, BASE - DURATION)
+    assert index.has_conflict(1, BASE + DURATION - timedelta(minutes=1))
+    assert index.has_conflict(1, BASE - DURATION + timedelta(minutes=1))
+    assert index.has_conflict(1, BASE)
+    assert index.next_free(1, BASE) == BASE + DURATION
+    assert index.next_free(1, BASE - DURATION) == BASE - DURATION
+
+
+def test_next_free_skips_back_to_back_bookings():
+    index = build([(1, BASE + DURATION * i) for i in range(5)] + [(1, BASE + DURATION * 6)])
+    assert index.next_free(1, BASE + timedelta(minutes=30)) == BASE + DURATION * 5
+    assert index.next_free(1, BASE + DURATION * 5) == BASE + DURATION * 5
+    assert index.next_free(1, BASE + DURATION * 5 + timedelta(minutes=1)) == BASE + DURATION * 7
+
+
+def test_remove_and_count_between():
+    index = build([(1, BASE), (1, BASE + DURATION), (1, BASE + DURATION)])
+    assert index.count_between(1, BASE, BASE + DURATION) == 3
+    index.remove(1, BASE + DURATION)
+    assert index.count_between(1, BASE, BASE + DURATION) == 2
+    index.remove(1, BASE + timedelta(minutes=1))
+    index.remove(2, BASE)
+    assert index.count_between(1, BASE, BASE + DURATION) == 2
+    assert index.count_between(2, BASE, BASE + DURATION) == 0
+
+
+def test_lookups_stay_logarithmic():
+    # 100k bookings on one specialist with one free slot between each; a linear scan per lookup would take minutes
+    index = build([(1, BASE + 2 * DURATION * i) for i in range(100000)])
+    started = time.perf_counter()
+    for i in range(10000):
+        start = BASE + timedelta(minutes=7 * i)
+        index.has_conflict(1, start)
+        index.next_free(1, start)
+    assert time.perf_counter() - started < 1
@@ -0,0 +1,149 @@
+#tests/test_storage.py
+# SQLiteStorage write-behind and read-after-TTL, and create_storage() against a Redis stand-in
+import asyncio
+import sqlite3
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+import storage
+from storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=42, chat_id=1, user_id=1)
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def rows(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute('SELECT key, state, data FROM fsm').fetchall()
+
+
+def test_instances_sharing_a_file_see_writes_after_flush_and_ttl(tmp_path):
+    path = str(tmp_path / 'fsm.db')
+
+    async def scenario():
+        a = SQLiteStorage(path, flush_interval=60, ttl=0.2)
+        b = SQLiteStorage(path, flush_interval=60, ttl=0.2)
+        assert await b.get_data(KEY) == {}
+        await a.set_data(KEY, {'step': 1})
+        await a.set_state(KEY, 'Form:name')
+        await a.flush()
+        # b still serves its cached read until the TTL runs out
+        assert await b.get_data(KEY) == {}
+        await asyncio.sleep(0.25)
+        assert await b.get_data(KEY) == {'step': 1}
+        assert await b.get_state(KEY) == 'Form:name'
+        # b's own unflushed write wins over a's stored row, even past the TTL
+        await b.set_data(KEY, {'step': 2})
+        await a.set_data(KEY, {'step': 3})
+        await a.flush()
+        await asyncio.sleep(0.25)
+        assert await b.get_data(KEY) == {'step': 2}
+        await b.flush()
+        await asyncio.sleep(0.25)
+        assert await a.get_data(KEY) == {'step': 2}
+        await a.close()
+        await b.close()
+    run(scenario())
+
+
+def test_clear_deletes_the_row(tmp_path):
+    path = str(tmp_path / 'fsm.db')
+
+    async def scenario():
+        fsm = SQLiteStorage(path, flush_interval=60)
+        state = FSMContext(fsm, KEY)
+        await state.set_state('Form:name')
+        await state.update_data(name='Клиент')
+        await fsm.flush()
+        assert len(rows(path)) == 1
+        await state.clear()
+        await fsm.flush()
+        assert rows(path) == []
+        assert await state.get_data() == {}
+        await fsm.close()
+    run(scenario())
+
+
+def test_close_flushes_pending_writes(tmp_path):
+    path = str(tmp_path / 'fsm.db')
+
+    async def scenario():
+        fsm = SQLiteStorage(path, flush_interval=60)
+        await fsm.set_state(KEY, 'Form:city')
+        await fsm.set_data(KEY, {'city': 'Москва'})
+        await fsm.close()
+        reopened = SQLiteStorage(path)
+        assert await reopened.get_state(KEY) == 'Form:city'
+        assert await reopened.get_data(KEY) == {'city': 'Москва'}
+        await reopened.close()
+    run(scenario())
+
+
+# Just enough of the Redis protocol (RESP3) for RedisStorage: GET, SET and DEL on bulk strings
+class RedisStandIn:
+    def __init__(self):
+        self.values = {}
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        return f"redis://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/0"
+
+    async def handle(self, reader, writer):
+        while line := await reader.readline():
+            args = []
+            for _ in range(int(line[1:])):
+                size = int((await reader.readline())[1:])
+                args.append((await reader.readexactly(size + 2))[:-2])
+            writer.write(self.reply(args))
+            await writer.drain()
+        writer.close()
+
+    def reply(self, args):
+        command = args[0].upper()
+        if command == b'GET':
+            value = self.values.get(args[1])
+            return b'_\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+        if command == b'SET':
+            self.values[args[1]] = args[2]
+            return b'+OK\r\n'
+        if command in (b'DEL', b'UNLINK'):
+            return b':%d\r\n' % sum(self.values.pop(key, None) is not None for key in args[1:])
+        if command == b'HELLO':
+            # redis-py asks for RESP3, so nulls below are '_'
+            return b'%%1\r\n$5\r\nproto\r\n:%s\r\n' % args[1]
+        # CLIENT SETINFO, SELECT and other connection setup
+        return b'+OK\r\n'
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+def test_create_storage_redis_against_stand_in(monkeypatch):
+    pytest.importorskip('redis')
+    from aiogram.fsm.storage.redis import RedisStorage
+
+    async def scenario():
+        server = RedisStandIn()
+        monkeypatch.setattr(storage, 'FSM_STORAGE', 'redis')
+        monkeypatch.setattr(storage, 'REDIS_URL', await server.start())
+        fsm = storage.create_storage()
+        assert isinstance(fsm, RedisStorage)
+        state = FSMContext(fsm, KEY)
+        await state.set_state('Form:phone')
+        await state.update_data(phone='+70000000000')
+        assert await state.get_state() == 'Form:phone'
+        assert await state.get_data() == {'phone': '+70000000000'}
+        assert len(server.values) == 2
+        await state.clear()
+        assert server.values == {}
+        await fsm.close()
+        await server.stop()
+    run(scenario())
@@ -0,0 +1,76 @@
+#tests/test_webhook.py
+# WebhookServer end to end: a real aiohttp site on an ephemeral port, the Bot API served by MockTelegramAPI
+import asyncio
+import aiohttp
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.client.telegram import TelegramAPIServer
+import webhook
+from keyboards import KeyboardSession
+from loadtest import MockTelegramAPI, message_update
+
+
+def test_webhook_end_to_end(monkeypatch):
+    monkeypatch.setattr(webhook, 'WEBHOOK_SECRET', 'secret')
+
+    async def scenario():
+        api = MockTelegramAPI()
+        api_server = await api.start()
+        # As bot.py builds it with API_SERVER set
+        bot = Bot(token='42:WEBHOOK', session=KeyboardSession(api=TelegramAPIServer.from_base(api_server)))
+        dp = Dispatcher()
+        seen, release = [], asyncio.Event()
+
+        @dp.message()
+        async def record(message):
+            seen.append(message.text)
+            if message.text == 'slow':
+                await release.wait()
+
+        server = webhook.WebhookServer(dp, bot)
+        runner = web.AppRunner(server.make_app())
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        # setWebhook went to the mock on startup
+        assert api.calls == 1
+
+        async with aiohttp.ClientSession() as http:
+            async def post(update, secret='secret'):
+                async with http.post(base + webhook.WEBHOOK_PATH, json=update,
+                                     headers={'X-Telegram-Bot-Api-Secret-Token': secret}) as resp:
+                    return resp.status
+
+            async def health():
+                async with http.get(base + '/health') as resp:
+                    return await resp.json()
+
+            assert await post(message_update(1, 7, 'wrong'), secret='nope') == 401
+            assert await post(message_update(2, 7, 'hello')) == 200
+            assert await post(message_update(3, 7, 'slow')) == 200
+            for _ in range(100):
+                if seen == ['hello', 'slow']:
+                    break
+                await asyncio.sleep(0.01)
+            assert seen == ['hello', 'slow']
+            assert await health() == {'status': 'ok', 'inflight': 1, 'processed': 1}
+
+            # Shutdown stops taking updates but waits for the one in flight
+            stopping = asyncio.create_task(runner.shutdown())
+            await asyncio.sleep(0.05)
+            assert await post(message_update(4, 7, 'late')) == 503
+            assert await health() == {'status': 'stopping', 'inflight': 1, 'processed': 1}
+            assert not stopping.done()
+            release.set()
+            await asyncio.wait_for(stopping, 5)
+            assert seen == ['hello', 'slow']
+            assert server.processed == 2
+        await runner.cleanup()
+        await api.stop()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(scenario())
+    finally:
+        loop.close()
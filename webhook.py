@@ -0,0 +1,77 @@
+#webhook.py
+import asyncio
+import logging
+from aiohttp import web
+from aiogram.types import Update
+from config import (WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET,
+                    WEBHOOK_MAX_CONCURRENCY)
+
+
+# Receives updates over HTTP and processes up to max_concurrency of them at once
+class WebhookServer:
+    def __init__(self, dp, bot, max_concurrency: int = WEBHOOK_MAX_CONCURRENCY):
+        self.dp = dp
+        self.bot = bot
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.tasks = set()
+        self.accepting = True
+        self.processed = 0
+
+    async def handle_update(self, request: web.Request):
+        if WEBHOOK_SECRET and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET:
+            return web.Response(status=401)
+        if not self.accepting:
+            # Telegram retries non-2xx responses, so nothing is lost during shutdown
+            return web.Response(status=503)
+        update = Update.model_validate(await request.json(), context={'bot': self.bot})
+        # Waiting here pushes back on Telegram instead of queueing without bound
+        await self.semaphore.acquire()
+        task = asyncio.create_task(self._process(update))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            logging.error(f"Ошибка обработки обновления {update.update_id}: {e}", exc_info=True)
+        finally:
+            self.processed += 1
+            self.semaphore.release()
+
+    async def health(self, request: web.Request):
+        return web.json_response({
+            'status': 'ok' if self.accepting else 'stopping',
+            'inflight': len(self.tasks),
+            'processed': self.processed,
+        })
+
+    async def on_startup(self, app: web.Application):
+        await self.dp.emit_startup(bot=self.bot, dispatcher=self.dp)
+        await self.bot.set_webhook(
+            WEBHOOK_URL + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=self.dp.resolve_used_update_types()
+        )
+
+    async def on_shutdown(self, app: web.Application):
+        # Stop taking new updates and let in-flight handlers finish.
+        # The webhook stays registered so other instances keep receiving updates.
+        self.accepting = False
+        if self.tasks:
+            await asyncio.wait(self.tasks, timeout=30)
+        await self.dp.emit_shutdown(bot=self.bot, dispatcher=self.dp)
+        await self.bot.session.close()
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post(WEBHOOK_PATH, self.handle_update)
+        app.router.add_get('/health', self.health)
+        app.on_startup.append(self.on_startup)
+        app.on_shutdown.append(self.on_shutdown)
+        return app
+
+
+def run_webhook(dp, bot):
+    web.run_app(WebhookServer(dp, bot).make_app(), host=WEBHOOK_HOST, port=WEBHOOK_PORT)